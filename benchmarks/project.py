@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+import pickle
+import random
+import statistics
+import sys
+import tempfile
+import timeit
+
+# The benchmarks draw the project without a window, so SDL is given its dummy video driver before pygame starts
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+
+from logic.electronics import Wire
+from logic.nets import NetTable
+from logic.parts import parse
+from logic.simulation import Simulation, build_netlist
+from protosim.project import Project, Occupier, SaveState
+from runtime.environment import Environment
+
+# Chips placed on the generated breadboards, which all have power on pins 14 and 7
+CHIPS = ("ic-74hc00", "ic-74hc02", "ic-74hc04", "ic-74hc08", "ic-74hc32", "ic-74hc86")
+
+# The shortest time in seconds of a run of a benchmark
+RUN_TIME = 0.02
+
+# A benchmark is reported as slower than its baseline if its median grows by more than this factor
+TOLERANCE = 1.25
+
+
+# Place a large part on the project grid at the given coordinate, with an occupier on every other cell it covers
+def place_board(project, board, coordinate):
+    project.boards[coordinate] = board
+    for row in range(board.size[0]):
+        for column in range(board.size[1]):
+            if (row, column) != (0, 0):
+                project.boards[(coordinate[0] + row, coordinate[1] + column)] = Occupier(coordinate)
+
+
+# Build a project with the given numbers of breadboards, chips, wires and LEDs. Every chip is powered by the supply,
+# every LED has its cathode wired to ground, and the remaining wires join random holes, every fifth as a resistor
+def generate(parts, env, boards=2, ics=8, wires=100, leds=16, seed=0):
+    generator = random.Random(seed)
+    project = Project(1000, 700, env)
+    board_config, supply_config = parts[0]["breadboard-830"], parts[2]["supply-5v"]
+    supply = supply_config[1](*supply_config[0], env)
+    place_board(project, supply, (0, 0))
+    breadboards = []
+    for index in range(boards):
+        breadboard = board_config[1](*board_config[0], env)
+        place_board(project, breadboard, (supply.size[0], index * breadboard.size[1]))
+        breadboards.append(breadboard)
+
+    def point(breadboard, segment, column, row):
+        return breadboard.main_board_rects[(segment, 0, column, row, "main")][2]
+
+    # Chips sit across the middle of each breadboard, eight to a board
+    columns = breadboard.main_board_config.per_segment_columns
+    slots = [(breadboard, column) for column in range(0, columns - 6, 8) for breadboard in breadboards]
+    for index, (breadboard, column) in enumerate(slots[:ics]):
+        chip_config = parts[1][CHIPS[index % len(CHIPS)]]
+        chip = chip_config[1](*chip_config[0], env)
+        hole = point(breadboard, 0, column, 4)
+        breadboard.plugins[hole] = chip
+        chip.pins_to_nodes = breadboard.ic_requirements(hole.discriminator, chip.dip_count)
+        project.wires.append(Wire(supply.points[0], point(breadboard, 0, column, 0)))
+        project.wires.append(Wire(supply.points[1], point(breadboard, 1, column + 6, 0)))
+
+    # LEDs sit in the lower half of the breadboards, each with its own column
+    led_config = parts[2]["led-red"]
+    holes = [(breadboard, column) for column in range(columns - 1) for breadboard in breadboards]
+    for breadboard, column in generator.sample(holes, min(leds, len(holes))):
+        led = led_config[1](*led_config[0], env)
+        led.anode_point, led.cathode_point = point(breadboard, 1, column, 2), point(breadboard, 1, column + 1, 3)
+        breadboard.plugins[led.anode_point] = led
+        project.wires.append(Wire(point(breadboard, 1, column + 1, 4), supply.points[1]))
+
+    for index in range(wires):
+        ends = [point(generator.choice(breadboards), generator.randrange(2), generator.randrange(columns),
+                      generator.randrange(4)) for _ in range(2)]
+        wire = Wire(*ends)
+        if index % 5 == 4:
+            wire.resistance = 220.0
+        project.wires.append(wire)
+    return project
+
+
+# Time a function, returning the median and fastest of several runs in seconds. Fast functions are called several
+# times in each run, so that each run is long enough to be timed reliably
+def measure(function, repeat):
+    number = max(1, int(RUN_TIME / timeit.timeit(function, number=1)))
+    times = [i / number for i in timeit.repeat(function, number=number, repeat=repeat)]
+    return {"median": statistics.median(times), "min": min(times)}
+
+
+# Time each stage of handling a generated project, from creating the holes of a breadboard to saving and loading it
+def benchmark(parts, env, repeat=5, **sizes):
+    project = generate(parts, env, **sizes)
+    breadboard = next(i for i in project.boards.values() if hasattr(i, "main_board_config"))
+    netlist, _ = build_netlist(project, NetTable())
+    netlist = netlist.canonical()
+    build_netlist(project)
+    path = os.path.join(tempfile.mkdtemp(), "benchmark.dev")
+
+    # Saving and loading go through a file, as they do in the editor. The save state is written without marking a
+    # change, which would add to the undo history on every run and slow down the stages timed after it
+    def save():
+        with open(path, "wb") as file:
+            pickle.dump(SaveState(project.boards, project.wires, project.display_name), file)
+
+    def load():
+        with open(path, "rb") as file:
+            project.load_save_state(file.read())
+
+    # The project keeps its surface until the scene changes, so the last drawn scene is forgotten before each draw to
+    # time a full redraw rather than the early return
+    def surface():
+        project.scene = None
+        return project.surface()
+
+    timings = {
+        "create_rects": measure(lambda: breadboard.create_rects(breadboard.main_board_config, "main"), repeat),
+        "nets": measure(lambda: NetTable().sync(
+            [(i.point_a.common, i.point_b.common) for i in project.wires if i.resistance == 0]), repeat),
+        "netlist": measure(lambda: build_netlist(project, NetTable()), repeat),
+        "netlist_warm": measure(lambda: build_netlist(project), repeat),
+        "operating_point": measure(lambda: Simulation().solve(netlist), repeat),
+        "surface": measure(surface, repeat),
+        "undo_snapshot": measure(project.make_save_state, repeat),
+        "save": measure(save, repeat),
+        "load": measure(load, repeat),
+    }
+    os.remove(path)
+    return {"parameters": dict(sizes, repeat=repeat, elements=len(netlist), total_wires=len(project.wires)),
+            "timings": timings}
+
+
+# Compare timings with a baseline, returning a line for each benchmark and whether any has become slower
+def compare(report, baseline, tolerance=TOLERANCE):
+    lines, slower = [], False
+    for name, timing in report["timings"].items():
+        if name not in baseline["timings"]:
+            lines.append(f"{name:>16} {timing['median'] * 1e3:>10.3f}ms {'':>12} new")
+            continue
+        ratio = timing["median"] / baseline["timings"][name]["median"]
+        slower |= ratio > tolerance
+        verdict = "slower" if ratio > tolerance else "faster" if ratio < 1 / tolerance else "same"
+        lines.append(f"{name:>16} {timing['median'] * 1e3:>10.3f}ms {ratio:>11.2f}x {verdict}")
+    return lines, slower
+
+
+# Run the benchmarks on a generated project, print them as JSON and compare them with a stored baseline
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.project",
+                                     description="Time de:volt on a generated project without a display")
+    parser.add_argument("--boards", type=int, default=2, help="number of breadboards")
+    parser.add_argument("--ics", type=int, default=8, help="number of chips")
+    parser.add_argument("--wires", type=int, default=100, help="number of random wires, besides those powering parts")
+    parser.add_argument("--leds", type=int, default=16, help="number of LEDs")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random wires and LED positions")
+    parser.add_argument("--repeat", type=int, default=5, help="number of runs of each benchmark")
+    parser.add_argument("-o", "--output", default=None, help="file to store the results in, to use as a baseline")
+    parser.add_argument("--baseline", default=None, help="file of stored results to compare with")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="factor by which a benchmark may slow down before it fails the comparison")
+    args = parser.parse_args(args)
+
+    pygame.font.init()
+    pygame.display.init()
+    pygame.display.set_mode((1000, 700))
+    env = Environment()
+    pygame.env = env
+    parts = parse(os.path.join(env.get_main_path(), "assets", "parts.xml"))
+
+    report = benchmark(parts, env, args.repeat, boards=args.boards, ics=args.ics, wires=args.wires, leds=args.leds,
+                       seed=args.seed)
+    json.dump(report, sys.stdout, indent=1)
+    sys.stdout.write("\n")
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=1)
+
+    if args.baseline is not None:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if baseline["parameters"] != report["parameters"]:
+            sys.stderr.write("The baseline was run with different parameters\n")
+        lines, slower = compare(report, baseline, args.tolerance)
+        sys.stderr.write("\n".join(lines) + "\n")
+        sys.exit(1 if slower else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import argparse
+import gc
+import json
+import os
+import pickle
+import random
+import sys
+import time
+
+# The soak test runs without a window, so SDL is given its dummy video driver before pygame starts
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from PySpice.Spice.NgSpice.Shared import NgSpiceShared
+
+from benchmarks.project import generate
+from logic.headless import load
+from logic.parts import IntegratedCircuit, Switch, parse, rejuvenate_wires
+from logic.simulation import ERROR_WARNING
+from logic.worker import SimulationWorker
+from runtime.environment import Environment
+
+# The number of simulate and modify cycles run on each project
+CYCLES = 200000
+
+# Memory, nodes and handles are sampled after this many cycles
+SAMPLE_INTERVAL = 1000
+
+# The project is reloaded from a save state after this many cycles, as undo does, so that its nodes are regenerated
+RELOAD_INTERVAL = 100
+
+# The soak test fails if resident memory grows by more than this many megabytes after the first sample
+MEMORY_LIMIT = 64
+
+# The soak test fails if the number of open handles grows by more than this after the first sample
+HANDLE_LIMIT = 8
+
+# How long in seconds to wait for the worker to solve each change before counting it as timed out, which includes
+# starting the worker process, and how long to sleep between polls while waiting
+SOLVE_TIMEOUT = 10
+POLL_DELAY = 0.0005
+
+
+# Return the resident memory of this process, or of another process given its id, in bytes. Only the peak of this
+# process is known where there is no /proc, and nothing on Windows
+def resident_memory(pid="self"):
+    try:
+        with open(f"/proc/{pid}/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    if resource is None or pid != "self":
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# Return the number of files, pipes and sockets this process, or another process given its id, has open, or None where
+# they cannot be listed
+def open_handles(pid="self"):
+    for path in (f"/proc/{pid}/fd", "/dev/fd" if pid == "self" else None):
+        try:
+            return len(os.listdir(path))
+        except (OSError, TypeError):
+            pass
+    return None
+
+
+# Return whether ngspice can be loaded, as a project with chips that have no logic model cannot be soaked without it
+def spice_available():
+    try:
+        NgSpiceShared.new_instance()
+    except OSError:
+        return False
+    return True
+
+
+# Make a random change to a project, as a user would: toggling a switch, moving the end of a wire to where another
+# wire ends, or swapping a wire between a link and a resistor
+def modify(project, generator):
+    switches = [i for board in project.boards.values() for i in getattr(board, "plugins", {}).values()
+                if isinstance(i, Switch)]
+    wires = project.wires
+    change = generator.randrange(3)
+    if change == 0 and switches:
+        switch = generator.choice(switches)
+        switch.state = 1 - switch.state
+    elif change == 1 and len(wires) > 1:
+        a, b = generator.sample(wires, 2)
+        a.point_b, b.point_b = b.point_b, a.point_b
+    elif wires:
+        wire = generator.choice(wires)
+        wire.resistance = 220.0 if wire.resistance == 0 else 0
+
+
+# Return the chips of a project in the order they were placed
+def chips(project):
+    return [i for board in project.boards.values() for i in getattr(board, "plugins", {}).values()
+            if isinstance(i, IntegratedCircuit)]
+
+
+# Replace the parts and wires of a project with copies loaded from a save state, as undo and redo do
+def reload(project):
+    project.boards, project.wires = pickle.loads(pickle.dumps((project.boards, project.wires)))
+    rejuvenate_wires(project.wires)
+
+
+# Simulate and modify a project for the given number of cycles through a simulation worker, as the editor does, so
+# that its process, queues and error handling are soaked along with the solvers. Each change is waited on until the
+# worker has solved it. After every interval, yield a sample of the resident memory and open handles of this process
+# and of the worker, the number of nodes held by the net table of the project, and the number of changes which were
+# solved with node voltages, which the worker failed to solve, and which timed out
+def soak(project, cycles=CYCLES, interval=SAMPLE_INTERVAL, reload_interval=RELOAD_INTERVAL, seed=0):
+    generator = random.Random(seed)
+    worker = SimulationWorker()
+    solved, errors, timeouts = 0, 0, 0
+    start = time.perf_counter()
+    try:
+        for cycle in range(1, cycles + 1):
+            modify(project, generator)
+            if reload_interval and cycle % reload_interval == 0:
+                reload(project)
+            worker.scheduler.wake()
+            worker.simulate(project)
+            waited = time.perf_counter()
+            while not worker.current() and time.perf_counter() - waited < SOLVE_TIMEOUT:
+                time.sleep(POLL_DELAY)
+                worker.poll()
+            result = worker.front[1]
+            if not worker.current():
+                timeouts += 1
+            elif result.warning == ERROR_WARNING:
+                errors += 1
+            elif result.node_analysis:
+                solved += 1
+            if cycle % interval == 0:
+                gc.collect()
+                yield {"cycle": cycle, "time": round(time.perf_counter() - start, 3), "memory": resident_memory(),
+                       "worker_memory": resident_memory(worker.process.pid), "nodes": len(project.nets.names),
+                       "handles": open_handles(), "worker_handles": open_handles(worker.process.pid),
+                       "solved": solved, "errors": errors, "timeouts": timeouts}
+    finally:
+        worker.close()
+
+
+# Compare the last sample of a soak test with the first, returning a message for each limit that was exceeded. The
+# net table forgets the nodes of a project once it has been reloaded, so the number of nodes it holds fails if it
+# doubles. Any change the worker failed to solve or timed out on fails, as does a project with chips that have no logic
+# model if it was never solved, as ngspice must then have failed on every change
+def check(samples, memory_limit=MEMORY_LIMIT, handle_limit=HANDLE_LIMIT, spice=False):
+    first, last = samples[0], samples[-1]
+    messages = []
+    for key, process in (("memory", "Resident memory"), ("worker_memory", "Resident memory of the worker")):
+        if first[key] is not None and last[key] is not None and last[key] - first[key] > memory_limit * 1024 * 1024:
+            messages.append(f"{process} grew by {(last[key] - first[key]) / 1024 / 1024:.1f}MB.")
+    for key, process in (("handles", "Open handles"), ("worker_handles", "Open handles of the worker")):
+        if first[key] is not None and last[key] is not None and last[key] - first[key] > handle_limit:
+            messages.append(f"{process} grew from {first[key]} to {last[key]}.")
+    if last["nodes"] > 2 * first["nodes"]:
+        messages.append(f"The nodes held by the net table grew from {first['nodes']} to {last['nodes']}.")
+    if last["errors"]:
+        messages.append(f"The worker failed to solve {last['errors']} changes.")
+    if last["timeouts"]:
+        messages.append(f"The worker timed out on {last['timeouts']} changes.")
+    if spice and not last["solved"]:
+        messages.append("The project was never solved, so the SPICE session was not soaked.")
+    return messages
+
+
+# Soak test the project files given on the command line, or a generated project, printing every sample as a line of
+# JSON and failing if memory, nodes or handles keep growing, the worker fails, or ngspice is never used. A project
+# which needs ngspice is skipped if it cannot be loaded, rather than failing on every change
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.soak",
+                                     description="Simulate and modify de:volt projects for a long time without a "
+                                                 "display, checking for leaks")
+    parser.add_argument("projects", nargs="*", type=argparse.FileType("rb"),
+                        help=".dev project files, or a generated project if none are given")
+    parser.add_argument("--cycles", type=int, default=CYCLES, help="number of simulate and modify cycles")
+    parser.add_argument("--interval", type=int, default=SAMPLE_INTERVAL, help="number of cycles between samples")
+    parser.add_argument("--reload", type=int, default=RELOAD_INTERVAL,
+                        help="number of cycles between reloading the project from a save state, or 0 to never reload")
+    parser.add_argument("--memory-limit", type=float, default=MEMORY_LIMIT,
+                        help="growth in resident memory in MB past which the test fails")
+    parser.add_argument("--handle-limit", type=int, default=HANDLE_LIMIT,
+                        help="growth in open handles past which the test fails")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random changes")
+    args = parser.parse_args(args)
+
+    projects = {}
+    for file in args.projects:
+        with file:
+            projects[file.name] = load(file)
+    if not projects:
+        pygame.font.init()
+        pygame.display.init()
+        pygame.display.set_mode((1000, 700))
+        env = Environment()
+        pygame.env = env
+        parts = parse(os.path.join(env.get_main_path(), "assets", "parts.xml"))
+        projects["generated"] = generate(parts, env)
+
+        # Every chip of the generated project has a logic model, so it is soaked again with the models removed to be
+        # solved by ngspice. A chip without a logic model only needs its power pins driven, so its components pass
+        # the rule check and reach the SPICE session
+        projects["generated-spice"] = generate(parts, env)
+        for chip in chips(projects["generated-spice"]):
+            chip.logic_model = ""
+
+    failed = False
+    available = spice_available()
+    for name, project in projects.items():
+        spice = any(not chip.logic_model for chip in chips(project))
+        if spice and not available:
+            sys.stderr.write(f"{name}: Skipped, as ngspice could not be loaded to solve its chips without a logic "
+                             f"model.\n")
+            continue
+        samples = []
+        for sample in soak(project, args.cycles, args.interval, args.reload, args.seed):
+            samples.append(sample)
+            sys.stdout.write(json.dumps(dict(sample, project=name)) + "\n")
+            sys.stdout.flush()
+        messages = check(samples, args.memory_limit, args.handle_limit, spice) if samples else []
+        for message in messages:
+            sys.stderr.write(f"{name}: {message}\n")
+        failed |= bool(messages)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
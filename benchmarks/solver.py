@@ -0,0 +1,47 @@
+import timeit
+
+import logic.mna
+
+from logic.mna import MNASolver
+from logic.simulation import Netlist, SupplySource, Resistor, Diode, SwitchContact
+
+
+# Build a square grid of resistors powered from one corner, with an LED and a switch hanging off every tenth net
+def grid(width):
+    net = lambda x, y: "gnd" if (x, y) == (width - 1, width - 1) else f"n{x}_{y}"
+    netlist = Netlist()
+    netlist.supplies.append(SupplySource(0, net(0, 0), "gnd", 5))
+    for x in range(width):
+        for y in range(width):
+            if x + 1 < width:
+                netlist.resistors.append(Resistor(len(netlist.resistors), net(x, y), net(x + 1, y), 100))
+            if y + 1 < width:
+                netlist.resistors.append(Resistor(len(netlist.resistors), net(x, y), net(x, y + 1), 220))
+            if (x * width + y) % 10 == 5:
+                netlist.diodes.append(Diode(f"{x}_{y}", net(x, y), "gnd", True))
+                netlist.switches.append(SwitchContact(f"{x}_{y}", net(x, y), "gnd", False))
+    return netlist
+
+
+# Time the first solve of a topology and the solve after toggling one switch, for the dense and sparse paths
+def benchmark(width, repeat, dense=True):
+    times = [] if dense else [(float("nan"), float("nan"), None)]
+    for sparse_size in (float("inf"), 0) if dense else (0,):
+        logic.mna.SPARSE_SIZE = sparse_size
+        netlist = grid(width)
+        solver = MNASolver()
+        first = timeit.timeit(lambda: (solver.__init__(), solver.operating_point(netlist)), number=1)
+        solver.operating_point(netlist)
+        netlist.switches[0] = netlist.switches[0]._replace(closed=not netlist.switches[0].closed)
+        toggle = timeit.timeit(lambda: solver.operating_point(netlist), number=repeat) / repeat
+        times.append((first, toggle, solver.size))
+    return times
+
+
+if __name__ == "__main__":
+    print(f"{'rows':>8} {'dense first':>12} {'dense toggle':>13} {'sparse first':>13} {'sparse toggle':>14}")
+    for width in (3, 5, 8, 10, 14, 20, 30, 50, 100):
+        # The dense path takes minutes for the largest grid, so only the sparse path is timed
+        (dense_first, dense_toggle, _), (sparse_first, sparse_toggle, size) = benchmark(width, 5, width <= 50)
+        print(f"{size:>8} {dense_first * 1e3:>10.3f}ms {dense_toggle * 1e3:>11.3f}ms "
+              f"{sparse_first * 1e3:>11.3f}ms {sparse_toggle * 1e3:>12.3f}ms")
@@ -0,0 +1,240 @@
+import hashlib
+import json
+import os
+
+from collections import namedtuple
+
+from runtime.environment import get_data_path
+
+# Named tuples for readable code
+CacheKey = namedtuple("CacheKey", "digest nets diodes")
+
+# The most space the cached results may take up on disk before the least recently used are removed
+CACHE_LIMIT = 64 * 1024 * 1024
+
+# The most refinements made when searching for the canonical labelling of the nets of a circuit
+SEARCH_BUDGET = 128
+
+
+# Return a short hash of the given values
+def digest(*values):
+    return hashlib.blake2b(repr(values).encode(), digest_size=16).hexdigest()
+
+
+# Describe every element of a netlist by its kind, its values and the nets of its terminals. The terminals of
+# elements which conduct the same way in both directions are unordered, and element names are left out as they only
+# depend on the order in which parts were placed
+def elements(netlist):
+    described = [("V", (i.voltage,), (i.positive, i.negative), True) for i in netlist.supplies]
+    described += [("X", (i.part, i.raw_spice, i.spice_nodes, i.logic_model), i.pins, True) for i in netlist.ics]
+    described += [("S", (i.closed,), (i.a, i.b), False) for i in netlist.switches]
+    described += [("D", (i.alive,), (i.anode, i.cathode), True) for i in netlist.diodes]
+    described += [("R", (i.resistance,), (i.a, i.b), False) for i in netlist.resistors]
+    described += [("C", (i.frequency,), (i.output, i.vcc, i.gnd), True) for i in netlist.clocks]
+    return described
+
+
+# Refine the colour of every net by the colours of the elements around it, and the colour of every element by the
+# colours of its nets, until no more nets can be told apart. Return the colours of the nets
+def refine(described, bases, nets):
+    distinct = len(set(nets.values()))
+    while True:
+        colours = []
+        for base, (_, _, terminals, ordered) in zip(bases, described):
+            terminal_colours = [nets[i] for i in terminals]
+            colours.append(digest(base, terminal_colours if ordered else sorted(terminal_colours)))
+
+        neighbours = {net: [] for net in nets}
+        for colour, (_, _, terminals, ordered) in zip(colours, described):
+            for role, net in enumerate(terminals):
+                neighbours[net].append((colour, role if ordered else None))
+        refined = {net: digest(nets[net], sorted(neighbours[net], key=repr)) for net in nets}
+
+        if len(set(refined.values())) == distinct:
+            return nets
+        nets, distinct = refined, len(set(refined.values()))
+
+
+# Describe every element by its values and the labels of its nets, in an order which does not depend on the order of
+# the elements
+def form(described, bases, labels):
+    elements = []
+    for base, (_, _, terminals, ordered) in zip(bases, described):
+        terminals = [labels[i] for i in terminals]
+        elements.append((base, tuple(terminals if ordered else sorted(terminals))))
+    return sorted(elements)
+
+
+class LabellingSearch:
+    """The labelling search finds the canonical labelling of the nets of a circuit, which is the one giving the
+    smallest form among every way of telling apart the nets that refinement leaves with the same colour. Each tied net
+    is made distinct in turn and the search continues from each. A labelling with the same form as the first one found
+    is a symmetry of the circuit, which is used to skip the nets it maps onto each other, so circuits made of repeated
+    parts are searched in far fewer steps. The search gives up once it has made its budget of refinements."""
+
+    def __init__(self, described, bases, budget=None):
+        self.described = described
+        self.bases = bases
+        self.budget = SEARCH_BUDGET if budget is None else budget
+        self.first = None
+        self.first_path = None
+        self.best = None
+        self.symmetries = []
+
+    # Return the form and labels of the canonical labelling given the starting colours of the nets, or None if the
+    # budget ran out
+    def search(self, nets):
+        try:
+            self.visit(nets, [])
+        except StopIteration:
+            return None
+        return self.best
+
+    # Search from the given colours, reached by making the nets of the path distinct. Return the depth the search
+    # should go back to when a symmetry shows the rest of this branch repeats what was already searched
+    def visit(self, nets, path):
+        if self.budget <= 0:
+            raise StopIteration
+        self.budget -= 1
+        nets = refine(self.described, self.bases, nets)
+        cells = {}
+        for net, colour in nets.items():
+            cells.setdefault(colour, []).append(net)
+        ties = [cell for colour, cell in sorted(cells.items()) if len(cell) > 1]
+        if not ties:
+            return self.leaf(nets, path)
+
+        # Nets which a symmetry fixing the path maps onto a net already searched from are skipped
+        symmetries = [i for i in self.symmetries if all(i[net] == net for net in path)]
+        searched = []
+        for net in ties[0]:
+            if any(self.orbit(symmetries, net, i) for i in searched):
+                continue
+            individual = dict(nets)
+            individual[net] = digest(nets[net], "individual", len(path))
+            depth = self.visit(individual, path + [net])
+            if depth is not None and depth < len(path):
+                return depth
+            searched.append(net)
+            symmetries = [i for i in self.symmetries if all(i[net] == net for net in path)]
+        return None
+
+    # Record a labelling where every net is distinct, returning the depth to go back to if it is a symmetry
+    def leaf(self, nets, path):
+        labels = {net: index for index, net in enumerate(sorted(nets, key=nets.get))}
+        result = form(self.described, self.bases, labels), labels
+        if self.first is None:
+            self.first, self.first_path, self.best = result, path, result
+            return None
+        if result[0] < self.best[0]:
+            self.best = result
+        if result[0] == self.first[0]:
+            nets_by_label = {label: net for net, label in self.first[1].items()}
+            self.symmetries.append({net: labels_net for net, labels_net in
+                                    ((nets_by_label[label], net) for net, label in labels.items())})
+            return next(i for i, (a, b) in enumerate(zip(path, self.first_path)) if a != b)
+        return None
+
+    # Return whether a net is mapped onto another by the group made by the given symmetries
+    @staticmethod
+    def orbit(symmetries, net, other):
+        reached, frontier = {net}, [net]
+        while frontier:
+            current = frontier.pop()
+            for symmetry in symmetries:
+                image = symmetry[current]
+                if image not in reached:
+                    reached.add(image)
+                    frontier.append(image)
+        return other in reached
+
+
+# Return the cache key of a netlist, which is the same for two netlists exactly when they are the same circuit, no
+# matter the order of their elements, the direction of their wires or the names of their nets. Nets are labelled
+# canonically, so results are stored by the canonical label of each net. A circuit so symmetric that the search for
+# its canonical labelling grows too large is keyed by the order of its own nets instead, which is still exact
+def cache_key(netlist):
+    described = elements(netlist)
+    nets = {net: "gnd" if net == "gnd" else "net" for _, _, terminals, _ in described for net in terminals}
+    bases = [digest(kind, values) for kind, values, _, _ in described]
+
+    result = LabellingSearch(described, bases).search(nets)
+    if result is None:
+        labels = {net: index for index, net in enumerate(nets)}
+        result = ("ordered", [(base, tuple(labels[i] for i in terminals))
+                              for base, (_, _, terminals, _) in zip(bases, described)]), labels
+    shape, labels = result
+
+    # LEDs are told apart by their values and the labels of their nets, so LEDs across the same nets share a key
+    start = len(netlist.supplies) + len(netlist.ics) + len(netlist.switches)
+    diodes = [digest(bases[i], [labels[net] for net in described[i][2]])
+              for i in range(start, start + len(netlist.diodes))]
+    return CacheKey(digest(shape), {net: str(label) for net, label in labels.items()}, diodes)
+
+
+class ResultCache:
+    """The result cache keeps the result of every circuit that has been simulated on disk, so that reopening a project
+    or building a circuit that was built before does not need a solve. Results are stored by the canonical label of
+    each net and LED rather than by their names, so they can be applied to any netlist of the same circuit. When the
+    cache grows past its limit the least recently used results are removed."""
+
+    def __init__(self, path=None, limit=CACHE_LIMIT):
+        self.path = os.path.join(get_data_path(), "cache") if path is None else path
+        self.limit = limit
+        self.total = None
+
+    # Return the file holding the result of a cache key
+    def file(self, key):
+        return os.path.join(self.path, f"{key.digest}.json")
+
+    # Return the cached node voltages, LED states and warning of a netlist, or None if it has not been simulated
+    def get(self, key):
+        try:
+            with open(self.file(key), encoding="utf-8") as file:
+                entry = json.load(file)
+            os.utime(self.file(key))
+        except (OSError, ValueError):
+            return None
+        node_analysis = {net: entry["nodes"][label] for net, label in key.nets.items() if label in entry["nodes"]}
+        led_states = [tuple(entry["leds"][label]) for label in key.diodes]
+        return node_analysis, led_states, entry["warning"]
+
+    # Store the node voltages, LED states and warning of a netlist
+    def put(self, key, node_analysis, led_states, warning):
+        entry = {"nodes": {key.nets[net]: voltage for net, voltage in node_analysis.items() if net in key.nets},
+                 "leds": dict(zip(key.diodes, led_states)), "warning": warning}
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            temporary = f"{self.file(key)}.{os.getpid()}.tmp"
+            with open(temporary, "w", encoding="utf-8") as file:
+                json.dump(entry, file)
+            os.replace(temporary, self.file(key))
+
+            # The size of the cache is only counted from disk when first needed or when it may be over its limit, as
+            # other processes share the same cache
+            if self.total is None:
+                self.evict()
+            self.total += os.path.getsize(self.file(key))
+            if self.total > self.limit:
+                self.evict()
+        except OSError:
+            pass
+
+    # Remove the least recently used results until the cache fits within its limit
+    def evict(self):
+        entries = []
+        with os.scandir(self.path) as files:
+            for entry in files:
+                if entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        self.total = total
@@ -0,0 +1,360 @@
+import heapq
+import math
+
+from collections import deque, namedtuple
+
+
+# Named tuples for readable code
+Gate = namedtuple("Gate", "output function inputs vcc gnd")
+Level = namedtuple("Level", "value strength")
+
+# Logic values and the strength with which a net is driven to them
+LOW, HIGH = 0, 1
+WEAK, GATE, SUPPLY = 1, 2, 3
+FLOATING = Level(None, None)
+
+# The most gate evaluations allowed per gate before a circuit is considered to be oscillating
+EVENT_LIMIT = 100
+
+# The voltage across a lit LED, which holds one end of it that is not driven by the power supply
+LED_FORWARD_VOLTAGE = 1.8
+
+
+class DigitalError(Exception):
+    """Raised when a circuit cannot be reduced to logic levels and must be simulated with SPICE instead"""
+
+
+class FloatingInputError(DigitalError):
+    """Raised when a gate input or chip power pin is not driven by anything, with the (element, number, name) of every
+    such pin so that they can be named in the same way as the rule check names them. Clock pins have no number"""
+
+    def __init__(self, pins):
+        super().__init__(f"{len(pins)} pins are floating")
+        self.pins = pins
+
+
+# Return the level of a clock output at the given time. Clocks start low and change level every half period
+def clock_level(frequency, time):
+    return math.floor(2 * frequency * time) % 2
+
+
+# Evaluate a gate function given its input values, where None represents an unknown value
+def evaluate(function, values):
+    if function in ("AND", "NAND"):
+        value = LOW if LOW in values else None if None in values else HIGH
+    elif function in ("OR", "NOR"):
+        value = HIGH if HIGH in values else None if None in values else LOW
+    elif function in ("XOR", "XNOR"):
+        value = None if None in values else sum(values) % 2
+    else:
+        value = values[0]
+    if value is not None and function in ("NOT", "NAND", "NOR", "XNOR"):
+        value = 1 - value
+    return value
+
+
+# Convert the text of a logic model into a list of (output, function, inputs) gates. Each line of the model is
+# written in the form "Y = NAND A B", where signals are either the names of the chip pins or internal signals
+def parse_logic_model(text):
+    gates = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if "=" not in line:
+            raise DigitalError(f"Missing output in '{line}'")
+        output, expression = (i.strip() for i in line.split("=", 1))
+        function, *inputs = expression.split() or ("",)
+        function = function.upper()
+        if function not in ("BUF", "NOT", "AND", "OR", "NAND", "NOR", "XOR", "XNOR") or not inputs:
+            raise DigitalError(f"Unknown logic function in '{line}'")
+        gates.append((output, function, tuple(inputs)))
+    return gates
+
+
+class DigitalEngine:
+    """The digital engine simulates circuits built from logic chips at the gate level instead of with transistors.
+    Every net holds a logic level and the strength it is driven with. Gates are only evaluated when one of their
+    inputs changes, using an event queue, so a change only propagates through the nets whose value changed.
+
+    Clocks are gates without inputs whose output changes at fixed times. In a transient simulation the engine steps
+    from one clock edge to the next, and every change of a net level is recorded with the time it happened."""
+
+    def __init__(self):
+        self.time = 0.0
+        self.clocks = {}
+        self.phases = {}
+        self.samples = {}
+        self.topology = None
+        self.nets = set()
+        self.gates = []
+        self.readers = {}
+        self.drivers = {}
+        self.constants = {}
+        self.resistors = {}
+        self.outputs = []
+        self.internal = {}
+        self.levels = {}
+        self.groups = {}
+        self.members = {}
+
+    # Build the gates, and the tables of which gates read and drive each signal, for a new circuit topology
+    def compile(self, netlist):
+        self.topology = netlist.topology()
+        self.nets = {"gnd"}
+        self.gates = []
+        self.readers = {}
+        self.drivers = {}
+        self.constants = {}
+        self.resistors = {}
+        self.clocks = {}
+        self.phases = {}
+        self.internal = {}
+        self.levels = {}
+
+        for supply in netlist.supplies:
+            if supply.negative != "gnd":
+                raise DigitalError("Power supply is not referenced to ground")
+            self.constants.setdefault(supply.positive, []).append(Level(HIGH, SUPPLY))
+            self.nets.add(supply.positive)
+        self.constants.setdefault("gnd", []).append(Level(LOW, SUPPLY))
+
+        for ic in netlist.ics:
+            pins = dict(zip(ic.spice_nodes, ic.pins))
+            self.nets.update(ic.pins)
+            if "vcc" not in pins or "gnd" not in pins:
+                raise DigitalError(f"{ic.part} has no power pins")
+
+            # Internal signals of a chip are given names which cannot collide with a net
+            def signal(name):
+                return pins[name] if name in pins else f"{ic.name}:{name}"
+
+            for output, function, inputs in parse_logic_model(ic.logic_model):
+                gate = Gate(signal(output), function, tuple(signal(i) for i in inputs), pins["vcc"], pins["gnd"])
+                index = len(self.gates)
+                self.gates.append(gate)
+                for i in set(gate.inputs + (gate.vcc, gate.gnd)):
+                    self.readers.setdefault(i, []).append(index)
+                if output in pins:
+                    self.drivers.setdefault(gate.output, []).append(index)
+
+        for clock in netlist.clocks:
+            gate = Gate(clock.output, "CLOCK", (), clock.vcc, clock.gnd)
+            index = len(self.gates)
+            self.gates.append(gate)
+            self.clocks[index] = clock.frequency
+            self.phases[index] = clock_level(clock.frequency, self.time)
+            self.nets |= {clock.output, clock.vcc, clock.gnd}
+            for i in {clock.vcc, clock.gnd}:
+                self.readers.setdefault(i, []).append(index)
+            self.drivers.setdefault(clock.output, []).append(index)
+
+        for resistor in netlist.resistors:
+            self.resistors.setdefault(resistor.a, set()).add(resistor.b)
+            self.resistors.setdefault(resistor.b, set()).add(resistor.a)
+            self.nets |= {resistor.a, resistor.b}
+        for contact in netlist.switches:
+            self.nets |= {contact.a, contact.b}
+        for diode in netlist.diodes:
+            self.nets |= {diode.anode, diode.cathode}
+
+        self.outputs = [None] * len(self.gates)
+
+    # Group the nets which are joined together by closed switch contacts
+    def group(self, netlist):
+        self.groups = {net: net for net in self.nets}
+
+        def find(net):
+            while self.groups[net] != net:
+                self.groups[net] = self.groups[self.groups[net]]
+                net = self.groups[net]
+            return net
+
+        for contact in netlist.switches:
+            if contact.closed:
+                self.groups[find(contact.a)] = find(contact.b)
+
+        self.members = {}
+        for net in self.nets:
+            self.members.setdefault(find(net), []).append(net)
+        self.groups = {net: find(net) for net in self.nets}
+
+    # Find the level a group of nets is driven to by supplies and gate outputs
+    def strong_level(self, group):
+        levels = set()
+        for net in self.members[group]:
+            levels.update(self.constants.get(net, ()))
+            for gate in self.drivers.get(net, ()):
+                if self.outputs[gate] is not None:
+                    levels.add(Level(self.outputs[gate], GATE))
+        if len({i.value for i in levels}) > 1:
+            raise DigitalError("Nets are driven to different levels")
+        return max(levels, key=lambda i: i.strength) if levels else None
+
+    # Find the level of a group of nets, which is taken through a resistor from a driven neighbour if it has no
+    # driver of its own
+    def resolve(self, group):
+        level = self.strong_level(group)
+        if level is not None:
+            return level
+        values = set()
+        for net in self.members[group]:
+            for neighbour in self.resistors.get(net, ()):
+                neighbour_level = self.strong_level(self.groups[neighbour])
+                if neighbour_level is not None:
+                    values.add(neighbour_level.value)
+        if len(values) > 1:
+            raise DigitalError("Net is pulled to different levels through resistors")
+        return Level(values.pop(), WEAK) if values else FLOATING
+
+    # Return the value of a signal, which is either a net or an internal signal of a chip
+    def value(self, signal):
+        if signal in self.levels:
+            return self.levels[signal].value
+        return self.internal.get(signal)
+
+    # Recalculate the levels of the given groups and any group reached from them through a resistor. Return the
+    # nets whose level changed
+    def update_levels(self, groups):
+        affected = set(groups)
+        for group in groups:
+            for net in self.members[group]:
+                affected.update(self.groups[i] for i in self.resistors.get(net, ()))
+        changed = []
+        for group in affected:
+            level = self.resolve(group)
+            for net in self.members[group]:
+                if self.levels.get(net) != level:
+                    if self.levels.get(net, FLOATING).value != level.value:
+                        self.samples.setdefault(net, []).append((self.time, level.value))
+                    self.levels[net] = level
+                    changed.append(net)
+        return changed
+
+    # Propagate changes through the gates until every net is stable
+    def propagate(self, queue):
+        queued = set(queue)
+        events = 0
+        while queue:
+            index = queue.popleft()
+            queued.discard(index)
+            events += 1
+            if events > EVENT_LIMIT * max(len(self.gates), 1):
+                raise DigitalError("Circuit is oscillating")
+
+            gate = self.gates[index]
+            powered = self.value(gate.vcc) == HIGH and self.value(gate.gnd) == LOW
+            if not powered:
+                value = None
+            elif gate.function == "CLOCK":
+                value = self.phases[index]
+            else:
+                value = evaluate(gate.function, [self.value(i) for i in gate.inputs])
+            if value == self.outputs[index]:
+                continue
+            self.outputs[index] = value
+
+            # Internal signals only feed other gates of the chip, whereas pins may change the level of nets
+            if gate.output in self.drivers:
+                changed = self.update_levels([self.groups[gate.output]])
+            else:
+                self.internal[gate.output] = value
+                changed = [gate.output]
+            for signal in changed:
+                for reader in self.readers.get(signal, ()):
+                    if reader not in queued:
+                        queued.add(reader)
+                        queue.append(reader)
+
+    # Bring every net to a stable level for the netlist at the present time
+    def settle(self, netlist):
+        try:
+            if netlist.topology() != self.topology:
+                self.compile(netlist)
+                queue = deque(range(len(self.gates)))
+            else:
+                queue = deque()
+
+            # Switch positions and supplies may have changed, so the levels of every net are recalculated and only
+            # the gates reading a net whose level changed are evaluated
+            self.group(netlist)
+            queued = set(queue)
+            for net in self.update_levels(set(self.groups.values())):
+                for reader in self.readers.get(net, ()):
+                    if reader not in queued:
+                        queued.add(reader)
+                        queue.append(reader)
+            self.propagate(queue)
+
+        except DigitalError:
+            self.topology = None
+            raise
+
+    # Step the simulated time to the given time, stopping at every clock edge on the way to propagate its change
+    def advance(self, end):
+        edges = []
+        for index, frequency in self.clocks.items():
+            edge = math.floor(2 * frequency * self.time) + 1
+            heapq.heappush(edges, (edge / (2 * frequency), index, edge))
+
+        try:
+            while edges and edges[0][0] <= end:
+                self.time, index, edge = heapq.heappop(edges)
+                self.phases[index] = edge % 2
+                self.propagate(deque([index]))
+                frequency = self.clocks[index]
+                heapq.heappush(edges, ((edge + 1) / (2 * frequency), index, edge + 1))
+        except DigitalError:
+            self.topology = None
+            raise
+        self.time = end
+
+    # Return the voltage of every net
+    def report(self, netlist):
+        # Every gate input and chip power pin must be driven, as they would be on a real breadboard. Levels do not
+        # pass through LEDs, which the rule check counts as joining their nets, so this can find pins it did not
+        floating = []
+        for ic in netlist.ics:
+            inputs = {"vcc", "gnd"} | {i for _, _, names in parse_logic_model(ic.logic_model) for i in names}
+            for number, (name, net) in enumerate(zip(ic.spice_nodes, ic.pins), 1):
+                if name in inputs and self.levels.get(net) == FLOATING:
+                    floating.append((ic, number, name))
+        for clock in netlist.clocks:
+            floating += [(clock, None, name) for name, net in (("vcc", clock.vcc), ("gnd", clock.gnd))
+                         if self.levels.get(net) == FLOATING]
+        if floating:
+            raise FloatingInputError(floating)
+
+        voltage = max((i.voltage for i in netlist.supplies), default=0)
+        node_analysis = {net: float(voltage if level.value == HIGH else 0) for net, level in self.levels.items()
+                         if level.value is not None and net != "gnd"}
+
+        # An LED conducting from a high net to a low net holds one end of it a forward voltage from the other, as it
+        # does when it is solved, so the LED states are found from the voltages by the same rule for every solver. The
+        # cathode is pulled up unless it is the supply itself, and an LED across the supply is left with the full
+        # voltage across it
+        for diode in netlist.diodes:
+            anode, cathode = self.levels.get(diode.anode, FLOATING), self.levels.get(diode.cathode, FLOATING)
+            if anode.value != HIGH or cathode.value != LOW:
+                continue
+            if cathode.strength != SUPPLY:
+                node_analysis[diode.cathode] = node_analysis[diode.anode] - LED_FORWARD_VOLTAGE
+            elif anode.strength != SUPPLY:
+                node_analysis[diode.anode] = LED_FORWARD_VOLTAGE
+
+        return node_analysis
+
+    # Simulate the netlist at the present time and return the voltage of every net
+    def simulate(self, netlist):
+        self.settle(netlist)
+        self.samples = {}
+        return self.report(netlist)
+
+    # Simulate the netlist from the present time for a duration. Return the voltage of every net at the end, and the
+    # (time, value) of every change of a net level on the way
+    def transient(self, netlist, duration):
+        self.samples = {}
+        self.settle(netlist)
+        self.advance(self.time + duration)
+        samples, self.samples = self.samples, {}
+        return self.report(netlist), samples
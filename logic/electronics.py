@@ -1,34 +1,15 @@
-import weakref
-import uuid
 from PySpice.Spice.Netlist import SubCircuit
 from ui.colours import *
 
 
 class Node:
     """The node structure represents any individual conductive material that may be connected to other nodes.
-    Each node has a unique identifier at initialisation, but may have a temporary identifier shared with other nodes
-    that it is connected to."""
-
-    instances = weakref.WeakSet()
-
-    def __init__(self):
-        self.uuid = str(uuid.uuid4())
-        self.temp = self.uuid
-        Node.instances.add(self)
-
-    @classmethod
-    def get_instances(cls):
-        return list(Node.instances)
+    The nodes it is connected to are found with a net table, which also gives each node its integer identifier."""
 
 
 class Sink(Node):
     """A subset of the node which represents the common ground in an electrical circuit."""
 
-    def __init__(self):
-        super().__init__()
-        self.uuid = "gnd"
-        self.temp = "gnd"
-
 
 class Wire:
     """A structure to represent the relationship between two nodes. It also contains the mapping for resistance
@@ -0,0 +1,115 @@
+from logic.digital import DigitalError, parse_logic_model
+
+# The most rule violations named in a warning, so that the banner stays readable
+VIOLATION_LIMIT = 3
+
+
+# Return the (number, name) of every pin of a chip which must be driven, which are its power pins and the inputs of
+# its logic model. The direction of the other pins of a chip without a logic model is not known
+def input_pins(ic):
+    names = {"vcc", "gnd"}
+    if ic.logic_model:
+        try:
+            names |= {signal for _, _, inputs in parse_logic_model(ic.logic_model) for signal in inputs}
+        except DigitalError:
+            pass
+    return [(number, name) for number, name in enumerate(ic.spice_nodes, 1) if name in names]
+
+
+# Return the names of the pins of a chip which may drive their net, which are the outputs of its logic model, or
+# every pin of a chip without one
+def output_pins(ic):
+    if ic.logic_model:
+        try:
+            return {output for output, _, _ in parse_logic_model(ic.logic_model)}
+        except DigitalError:
+            pass
+    return set(ic.spice_nodes)
+
+
+class RuleCheck:
+    """The rule check groups the nets of a netlist that are joined by elements, so that the mistakes which would make
+    a solve fail can be found on the net graph before solving. The checked rules are that every chip input and power
+    pin is reached from a supply or a chip output, and that no power supply is shorted by wires or closed switches."""
+
+    def __init__(self, netlist):
+        self.netlist = netlist
+        self.parent = {}
+
+    # Return the net at the root of the group containing the net
+    def find(self, net):
+        self.parent.setdefault(net, net)
+        while self.parent[net] != net:
+            self.parent[net] = self.parent[self.parent[net]]
+            net = self.parent[net]
+        return net
+
+    # Put the nets joined by the given (net, net) links into the same groups
+    def join(self, links):
+        self.parent = {}
+        for a, b in links:
+            self.parent[self.find(a)] = self.find(b)
+
+    # Return a message for every chip pin which nothing drives, following closed switches, resistors and LEDs
+    def floating_pins(self):
+        netlist = self.netlist
+        self.join([(i.a, i.b) for i in netlist.switches if i.closed] + [(i.a, i.b) for i in netlist.resistors] +
+                  [(i.anode, i.cathode) for i in netlist.diodes])
+
+        driven = {self.find("gnd")} | {self.find(i.positive) for i in netlist.supplies}
+        driven |= {self.find(i.output) for i in netlist.clocks}
+        for ic in netlist.ics:
+            outputs = output_pins(ic)
+            driven |= {self.find(net) for name, net in zip(ic.spice_nodes, ic.pins) if name in outputs}
+
+        pins = [(ic, number, name) for ic in netlist.ics for number, name in input_pins(ic)
+                if self.find(ic.pins[number - 1]) not in driven]
+        for clock in netlist.clocks:
+            pins += [(clock, None, name) for name, net in (("vcc", clock.vcc), ("gnd", clock.gnd))
+                     if self.find(net) not in driven]
+        return floating_messages(netlist, pins)
+
+    # Return a message for every power supply whose terminals are joined by wires or closed switches
+    def shorted_supplies(self):
+        netlist = self.netlist
+        closed = [i for i in netlist.switches if i.closed]
+        self.join([(i.a, i.b) for i in closed])
+
+        messages = []
+        for supply in netlist.supplies:
+            label = netlist.labels.get(supply.name, "power supply")
+            if supply.positive == supply.negative:
+                wires = netlist.shorts.get(supply.name)
+                messages.append(f"The {label} is shorted by the {wires}." if wires else f"The {label} is shorted.")
+            elif self.find(supply.positive) == self.find(supply.negative):
+                switches = dict.fromkeys(netlist.labels.get(i.name, "switch") for i in closed
+                                         if self.find(i.a) == self.find(supply.positive))
+                messages.append(f"The {label} is shorted through the {' and the '.join(switches)}.")
+        return messages
+
+
+# Return a message for every (element, number, name) chip or clock pin which nothing drives. Clock pins have no number
+def floating_messages(netlist, pins):
+    messages = []
+    for element, number, name in pins:
+        if number is None:
+            messages.append(f"The {name} pin of the {netlist.labels.get(element.name, 'clock')} is not connected to "
+                            f"anything that drives it.")
+        else:
+            messages.append(f"Pin {number} ({name}) of the {netlist.labels.get(element.name, element.part)} is not "
+                            f"connected to anything that drives it.")
+    return messages
+
+
+# Join messages into a warning, naming at most the first few of them
+def summarise(messages):
+    if len(messages) > VIOLATION_LIMIT:
+        messages = messages[:VIOLATION_LIMIT] + [f"There are {len(messages) - VIOLATION_LIMIT} more problems."]
+    return " ".join(messages)
+
+
+# Check the netlist for shorted supplies and floating chip pins before it is solved. Return a warning naming what is
+# wrong, or an empty string if the netlist can be solved
+def check(netlist):
+    rules = RuleCheck(netlist)
+    return summarise(rules.shorted_supplies() + rules.floating_pins())
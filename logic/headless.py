@@ -0,0 +1,128 @@
+import argparse
+import collections
+import json
+import os
+import pickle
+import sys
+
+# The JSON report is written to stdout, so pygame must not print its greeting there
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+
+from logic.cache import ResultCache
+from logic.parts import Breadboard, IntegratedCircuit, LED, PowerSupply, rejuvenate_wires
+from logic.simulation import Simulation, build_netlist, apply_result, describe
+from logic.worker import TRANSIENT_CHUNK
+from runtime.environment import Environment
+
+# The number of level changes kept for each net of a transient simulation, so that long runs only report the latest
+WAVEFORM_SAMPLES = 1024
+
+
+# Load a saved project without a display, returning its save state with the wires joined to the regenerated parts
+def load(file):
+    # Parts restore themselves in the environment attached to pygame, which has no textures when headless
+    pygame.env = Environment(headless=True)
+    project = pickle.load(file)
+    rejuvenate_wires(project.wires)
+    return project
+
+
+# Return where every net of a netlist can be probed on the bench, keyed by its canonical name. A net is found at the
+# supply terminals, wire ends and LED leads in it, as the holes they sit in, and at the chip and switch pins in it. The
+# netlist must have been built with the net table of the project
+def locate_nets(project, netlist):
+    names = netlist.canonical_names()
+    boards = [board for board in project.boards.values() if isinstance(board, Breadboard)]
+    indices = {id(board): index for index, board in enumerate(boards)}
+    locations = {}
+
+    def add(node, location):
+        net = project.nets.net(node)
+        if net in names and location not in locations.setdefault(names[net], []):
+            locations[names[net]].append(location)
+
+    def add_point(point):
+        if isinstance(point.parent, PowerSupply):
+            add(point.common, {"supply": point.parent.name, "label": describe(point)})
+        else:
+            add(point.common, dict(board=indices[id(point.parent)], **point.discriminator._asdict(),
+                                   label=describe(point)))
+
+    for supply in project.boards.values():
+        if isinstance(supply, PowerSupply):
+            for point in supply.points:
+                add_point(point)
+    for wire in project.wires:
+        add_point(wire.point_a)
+        add_point(wire.point_b)
+    for index, board in enumerate(boards):
+        for plugin, plugin_object in board.plugins.items():
+            if isinstance(plugin_object, LED):
+                add_point(plugin_object.anode_point)
+                add_point(plugin_object.cathode_point)
+            if isinstance(plugin_object, IntegratedCircuit):
+                label = f"{plugin_object.name} at column {plugin.discriminator.column + 1}"
+                for pin, node in plugin_object.pins_to_nodes.items():
+                    add(node, {"board": index, "part": plugin_object.name, "column": plugin.discriminator.column,
+                               "pin": plugin_object.spice_nodes[pin], "label": f"pin {pin + 1} of the {label}"})
+    return locations
+
+
+# Simulate a project and return a report of the node voltages, where each net can be found on the bench, the LED
+# states and any warning. A project with clocks is stepped through the given duration of simulated time, and the level
+# changes of each net are streamed into a bounded ring buffer to be reported as its waveform
+def simulate(project, simulation=None, duration=0):
+    simulation = Simulation(ResultCache()) if simulation is None else simulation
+    netlist, displays = build_netlist(project)
+    canonical = netlist.canonical()
+    result = simulation.solve(canonical)
+    waveforms = {}
+    chunks = round(duration / TRANSIENT_CHUNK) if len(canonical.clocks) else 0
+    for chunk in range(chunks + 1):
+        if chunk:
+            result = simulation.step(canonical, TRANSIENT_CHUNK)
+        for net, samples in result.samples.items():
+            waveforms.setdefault(net, collections.deque(maxlen=WAVEFORM_SAMPLES)).extend(samples)
+    apply_result(displays, result)
+    locations = locate_nets(project, netlist)
+
+    leds = []
+    boards = [board for board in project.boards.values() if isinstance(board, Breadboard)]
+    for index, board in enumerate(boards):
+        for plugin in board.plugins.values():
+            if isinstance(plugin, LED) and plugin in displays:
+                leds.append({"board": index, "name": plugin.name,
+                             "anode": plugin.anode_point.discriminator._asdict(),
+                             "cathode": plugin.cathode_point.discriminator._asdict(),
+                             "state": "dead" if not plugin.alive else "on" if plugin.state else "off"})
+
+    return {"nodes": result.node_analysis, "nets": {net: {"voltage": voltage, "locations": locations.get(net, [])}
+                                                    for net, voltage in result.node_analysis.items()},
+            "leds": leds, "waveforms": {net: list(samples) for net, samples in waveforms.items()},
+            "warning": result.warning}
+
+
+# Simulate the project files given on the command line and print a JSON report of each
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m logic.headless",
+                                     description="Simulate de:volt projects without a display and report as JSON")
+    parser.add_argument("projects", nargs="+", type=argparse.FileType("rb"), help=".dev project files")
+    parser.add_argument("--indent", type=int, default=None, help="indentation of the JSON output")
+    parser.add_argument("--no-cache", action="store_true", help="solve every project instead of reading cached results")
+    parser.add_argument("--duration", type=float, default=0,
+                        help="seconds of simulated time to step projects with clocks through, reporting the waveforms")
+    args = parser.parse_args(args)
+
+    reports = {}
+    for file in args.projects:
+        with file:
+            reports[file.name] = simulate(load(file), Simulation(None if args.no_cache else ResultCache()),
+                                          args.duration)
+    json.dump(reports, sys.stdout, indent=args.indent)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import math
+
+import numpy as np
+import scipy.sparse
+import scipy.sparse.linalg
+
+# Parameters of the LED diode model, which are the same as those given to ngspice
+# IS = Saturated Current, RS = Ohmic Parasitic Resistance, N = Emission Coefficient
+LED_IS = 1e-19
+LED_RS = 2.5
+LED_N = 1.6
+
+# Thermal voltage at the nominal temperature of 27 degrees celsius, and the conductance placed across each junction
+THERMAL_VOLTAGE = 0.025865
+GMIN = 1e-12
+
+# Newton iteration stops when every voltage changes by less than this, or fails after too many iterations
+ABSTOL = 1e-6
+RELTOL = 1e-3
+MAX_ITERATIONS = 200
+
+# Circuits with at least this many matrix rows are solved with a sparse LU factorisation, see benchmarks/solver.py
+SPARSE_SIZE = 200
+
+# The sparse factorisation keeps a diagonal pivot unless it is smaller than this fraction of the largest in its column
+PIVOT_THRESHOLD = 0.01
+
+
+class SolverError(Exception):
+    """Raised when the operating point of a circuit cannot be found, because part of it is floating, a power supply
+    is shorted or the iteration does not converge"""
+
+
+# Limit the change in voltage across each junction between Newton iterations, so the exponential cannot overflow
+def limit_junctions(new, old, thermal, critical):
+    limited = (new > critical) & (np.abs(new - old) > 2 * thermal)
+    if not limited.any():
+        return new
+    with np.errstate(invalid="ignore", divide="ignore"):
+        argument = 1 + (new - old) / thermal
+        forward = np.where(argument > 0, old + thermal * np.log(np.maximum(argument, 1e-300)), critical)
+        reverse = thermal * np.log(np.maximum(new, thermal) / thermal)
+    return np.where(limited, np.where(old > 0, forward, reverse), new)
+
+
+class MNASolver:
+    """The MNA solver finds the operating point of circuits made only of power supplies, resistors, switches and
+    LEDs without going through ngspice. Every net is given a row of a modified nodal analysis matrix, with an extra
+    row for the current through each power supply and a hidden net between each LED and its series resistance. The
+    LEDs are linearised around the current guess and the matrix is solved again until the voltages settle.
+
+    The position of every matrix entry is worked out once per topology, so each iteration only sums the values into
+    place. Small circuits are solved densely, and large circuits with a sparse LU factorisation whose fill-reducing
+    column ordering is found once and reused while only values change."""
+
+    def __init__(self):
+        self.topology = None
+        self.nets = {}
+        self.size = 0
+        self.devices = []
+        self.supplies = []
+        self.terminals = np.zeros((0, 2), dtype=int)
+        self.diodes = np.zeros((0, 2), dtype=int)
+        self.sources = np.zeros((0, 3), dtype=int)
+        self.rows = self.cols = self.keep = np.zeros(0, dtype=int)
+        self.entries = self.indices = self.indptr = np.zeros(0, dtype=int)
+        self.ordering = None
+
+    # Give every net, hidden net and supply current an index, and check that the circuit can be solved. Ground is
+    # given the last index, which is dropped before solving
+    def compile(self, netlist):
+        self.topology = None
+        links = [(i.a, i.b) for i in netlist.switches + netlist.resistors] + \
+                [(i.anode, i.cathode) for i in netlist.diodes]
+        nets = {}
+        for a, b in [(i.positive, i.negative) for i in netlist.supplies] + links:
+            for net in (a, b):
+                if net != "gnd":
+                    nets.setdefault(net, len(nets))
+
+        # Every net must have a path to ground, and the power supplies cannot form a loop, else the matrix is singular
+        groups = {net: net for net in list(nets) + ["gnd"]}
+
+        def find(net):
+            while groups[net] != net:
+                groups[net] = groups[groups[net]]
+                net = groups[net]
+            return net
+
+        for supply in netlist.supplies:
+            if find(supply.positive) == find(supply.negative):
+                raise SolverError("Power supply is shorted")
+            groups[find(supply.positive)] = find(supply.negative)
+        for a, b in links:
+            groups[find(a)] = find(b)
+        if any(find(net) != find("gnd") for net in nets):
+            raise SolverError("Circuit has a floating net")
+
+        count, diodes = len(nets), len(netlist.diodes)
+        self.size = count + diodes + len(netlist.supplies)
+        index = dict(nets, gnd=self.size)
+        self.nets = nets
+
+        # Conductances are the alterable switches and resistors, then the series resistance and junction of each LED
+        self.devices = [f'RS{i.name}' for i in netlist.switches] + [f'R{i.name}' for i in netlist.resistors]
+        self.supplies = [f'V{i.name}' for i in netlist.supplies]
+        terminals = [(index[i.a], index[i.b]) for i in netlist.switches + netlist.resistors]
+        terminals += [(index[i.anode], count + jndex) for jndex, i in enumerate(netlist.diodes)]
+        terminals += [(count + jndex, index[i.cathode]) for jndex, i in enumerate(netlist.diodes)]
+        self.terminals = np.array(terminals, dtype=int).reshape(-1, 2)
+        self.diodes = self.terminals[len(terminals) - diodes:]
+        self.sources = np.array([(index[i.positive], index[i.negative], count + diodes + jndex)
+                                 for jndex, i in enumerate(netlist.supplies)], dtype=int).reshape(-1, 3)
+
+        # Every value stamped into the matrix is given a row and column, and entries on the ground row or column
+        # are dropped
+        a, b = self.terminals[:, 0], self.terminals[:, 1]
+        positive, negative, row = self.sources[:, 0], self.sources[:, 1], self.sources[:, 2]
+        rows = np.concatenate((a, b, a, b, positive, negative, row, row))
+        cols = np.concatenate((a, b, b, a, row, row, positive, negative))
+        self.keep = (rows != self.size) & (cols != self.size)
+        self.rows, self.cols = rows[self.keep], cols[self.keep]
+        self.ordering = None
+        self.pattern(np.arange(self.size))
+        self.topology = netlist.topology()
+
+    # Find where each stamped value is summed into the compressed columns of a sparse matrix, with the rows and
+    # columns in the given order
+    def pattern(self, ordering):
+        keys = ordering[self.cols] * self.size + ordering[self.rows]
+        unique, self.entries = np.unique(keys, return_inverse=True)
+        self.indices = unique % self.size
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(unique // self.size, minlength=self.size))))
+
+    # Return the values stamped into the matrix for the given conductances
+    def stamps(self, conductances):
+        ones = np.ones(len(self.sources))
+        values = np.concatenate((conductances, conductances, -conductances, -conductances, ones, -ones, ones, -ones))
+        return values[self.keep]
+
+    # Solve the matrix of the given stamped values, densely for small circuits and sparsely for large ones
+    def solve(self, values, rhs):
+        if self.size < SPARSE_SIZE:
+            matrix = np.bincount(self.rows * self.size + self.cols, values, self.size * self.size)
+            try:
+                return np.linalg.solve(matrix.reshape(self.size, self.size), rhs)
+            except np.linalg.LinAlgError:
+                raise SolverError("Circuit matrix is singular") from None
+
+        matrix = scipy.sparse.csc_matrix((np.bincount(self.entries, values), self.indices, self.indptr),
+                                         shape=(self.size, self.size))
+        # The matrix is symmetric apart from the supply rows, so pivots are taken from the diagonal where possible to
+        # keep the fill of the ordering. Once the ordering is known it is built into the pattern of the matrix
+        try:
+            if self.ordering is None:
+                factor = scipy.sparse.linalg.splu(matrix, permc_spec="MMD_AT_PLUS_A", diag_pivot_thresh=PIVOT_THRESHOLD,
+                                                  options={"SymmetricMode": True})
+                self.ordering = factor.perm_c
+                self.pattern(self.ordering)
+                return factor.solve(rhs)
+            permuted = np.empty_like(rhs)
+            permuted[self.ordering] = rhs
+            factor = scipy.sparse.linalg.splu(matrix, permc_spec="NATURAL", diag_pivot_thresh=PIVOT_THRESHOLD,
+                                              options={"SymmetricMode": True})
+            return factor.solve(permuted)[self.ordering]
+        except RuntimeError:
+            raise SolverError("Circuit matrix is singular") from None
+
+    # Return the voltage of every net in the netlist
+    def operating_point(self, netlist):
+        if netlist.topology() != self.topology:
+            self.compile(netlist)
+        values = netlist.values()
+        count, size, diodes = len(self.nets), self.size, len(self.diodes)
+
+        # The switches, resistors and supplies keep the same value for every iteration
+        conductances = np.empty(len(self.terminals))
+        conductances[:len(self.devices)] = [1 / values[device][1] for device in self.devices]
+        conductances[len(self.devices):len(self.terminals) - diodes] = 1 / LED_RS
+        rhs = np.zeros(size + 1)
+        rhs[self.sources[:, 2]] = [values[device][1] for device in self.supplies]
+        anodes, cathodes = self.diodes[:, 0], self.diodes[:, 1]
+
+        thermal = LED_N * THERMAL_VOLTAGE
+        critical = thermal * math.log(thermal / (math.sqrt(2) * LED_IS))
+
+        # Junctions start at their critical voltage, as in SPICE, which is close to where a lit LED settles
+        junctions = np.full(diodes, critical)
+        voltages = None
+
+        for _ in range(MAX_ITERATIONS):
+            # Linearise each junction around its present voltage as a conductance in parallel with a current source
+            exponential = np.exp(junctions / thermal)
+            conductance = LED_IS * exponential / thermal + GMIN
+            current = LED_IS * (exponential - 1) + GMIN * junctions - conductance * junctions
+            conductances[len(conductances) - diodes:] = conductance
+            source = rhs - np.bincount(anodes, current, size + 1) + np.bincount(cathodes, current, size + 1)
+
+            solution = np.append(self.solve(self.stamps(conductances), source[:-1]), 0)
+            junction = solution[anodes] - solution[cathodes]
+            settled = voltages is not None and \
+                np.all(np.abs(solution[:count] - voltages[:count]) <= ABSTOL + RELTOL * np.abs(solution[:count])) and \
+                np.all(np.abs(junction - junctions) <= ABSTOL + RELTOL * np.abs(junction))
+            voltages = solution
+            if settled:
+                return {net: float(voltages[index]) for net, index in self.nets.items()}
+            junctions = limit_junctions(junction, junctions, thermal, critical)
+
+        raise SolverError("Operating point did not converge")
@@ -0,0 +1,129 @@
+import weakref
+
+from collections import Counter, deque
+
+from logic.electronics import Sink
+
+
+class NetTable:
+    """The net table is a persistent disjoint set of nodes, where each set is a net of nodes joined by wires or the
+    internal links of a part. The links of the project are compared with the links already in the table, so new links
+    only merge two nets, and removing a link only rebuilds the net it belonged to.
+
+    Every node is given a compact integer identifier the first time it is seen, and each net is named by the
+    identifier of its root written as a string, so net names have the same type as the ground net "gnd" and stay the
+    same from frame to frame until the topology changes. Names are made once and forgotten along with their nodes.
+    Parts and wires are given names from the same identifiers, so the elements of a netlist keep their names when
+    others are added or removed. The table belongs to the project whose nodes it names."""
+
+    def __init__(self):
+        self.names = weakref.WeakKeyDictionary()
+        self.count = 0
+        self.parent = {}
+        self.members = {}
+        self.sinks = {}
+        self.links = Counter()
+        self.neighbours = {}
+
+    # Return the node at the root of the set containing the node
+    def find(self, node):
+        root = node
+        while self.parent[root] is not root:
+            root = self.parent[root]
+        while self.parent[node] is not root:
+            self.parent[node], node = root, self.parent[node]
+        return root
+
+    # Add a node to the table as a net of its own
+    def add(self, node):
+        if node not in self.parent:
+            self.parent[node] = node
+            self.members[node] = {node}
+            self.sinks[node] = int(isinstance(node, Sink))
+
+    # Merge the nets of two nodes, keeping the root of the larger net
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a is b:
+            return
+        if len(self.members[a]) < len(self.members[b]):
+            a, b = b, a
+        self.parent[b] = a
+        self.members[a] |= self.members.pop(b)
+        self.sinks[a] += self.sinks.pop(b)
+
+    # Split a net back into single nodes and merge them again using only the links that remain
+    def rebuild(self, root):
+        nodes = self.members.pop(root)
+        self.sinks.pop(root)
+        for node in nodes:
+            if node in self.neighbours:
+                self.parent[node] = node
+                self.members[node] = {node}
+                self.sinks[node] = int(isinstance(node, Sink))
+            else:
+                del self.parent[node]
+        for node in nodes:
+            for neighbour in self.neighbours.get(node, ()):
+                self.union(node, neighbour)
+
+    # Update the table to hold exactly the given (node, node) links
+    def sync(self, links):
+        links = Counter((a, b) for a, b in links if a is not b)
+        removed = self.links - links
+        added = links - self.links
+        self.links = links
+
+        affected = set()
+        for (a, b), count in removed.items():
+            for node, neighbour in ((a, b), (b, a)):
+                self.neighbours[node][neighbour] -= count
+                if not self.neighbours[node][neighbour]:
+                    del self.neighbours[node][neighbour]
+                if not self.neighbours[node]:
+                    del self.neighbours[node]
+            affected.add(self.find(a))
+        for root in affected:
+            self.rebuild(root)
+
+        for (a, b), count in added.items():
+            self.add(a)
+            self.add(b)
+            self.neighbours.setdefault(a, Counter())[b] += count
+            self.neighbours.setdefault(b, Counter())[a] += count
+            self.union(a, b)
+
+    # Return the name of a node, part or wire, which is its integer identifier as a string, giving it the next
+    # identifier if it has not been seen before
+    def name(self, node):
+        name = self.names.get(node)
+        if name is None:
+            self.count += 1
+            name = self.names[node] = str(self.count)
+        return name
+
+    # Return the name of the net a node belongs to, which is the name of its root, or "gnd" for any net connected to a
+    # sink
+    def net(self, node):
+        if node not in self.parent:
+            return "gnd" if isinstance(node, Sink) else self.name(node)
+        root = self.find(node)
+        return "gnd" if self.sinks[root] else self.name(root)
+
+    # Return the shortest chain of links from a node to a sink as a list of nodes, or an empty list if there is none
+    def path_to_sink(self, node):
+        previous = {node: None}
+        queue = deque([node])
+        while queue:
+            node = queue.popleft()
+            if isinstance(node, Sink):
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = previous[node]
+                return path[::-1]
+            for neighbour in self.neighbours.get(node, ()):
+                if neighbour not in previous:
+                    previous[neighbour] = node
+                    queue.append(neighbour)
+        return []
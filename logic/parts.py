@@ -20,6 +20,19 @@ Rule = namedtuple("Rule", "segment repetition column row")
 SupplyInfo = namedtuple("SupplyInfo", "pos_rail neg_rail radius")
 Discriminator = namedtuple("Discriminator", "segment rep column row name")
 
+# Surfaces of plugins which have been drawn, by the type and state of the plugin and the holes of the breadboard it was
+# drawn for. Plugins which look the same share a surface, and there are only as many as the looks of the part list
+plugin_surfaces = {}
+
+
+# Return the surface of a plugin which looks as the key describes, drawing it only if no plugin has looked so before.
+# The surface is shared, so it is only ever blitted or copied
+def plugin_surface(key, draw):
+    surface = plugin_surfaces.get(key)
+    if surface is None:
+        surface = plugin_surfaces[key] = draw()
+    return surface
+
 
 # Input an XML element and return a named tuple with extracted information about a breadboard
 def get_board_config(element):
@@ -36,6 +49,12 @@ def get_board_config(element):
                        per_segment_rep_gap, rule)
 
 
+# Convert the position of the mouse to a pixel on the texture of a part drawn at the given position and scale
+def texture_position(real_pos, scale):
+    mouse = pygame.mouse.get_pos()
+    return math.floor((mouse[0] - real_pos[0]) / scale[0]), math.floor((mouse[1] - real_pos[1]) / scale[1])
+
+
 # Parse the part XML file and create Part objects for each entry
 def parse(xml_path):
     try:
@@ -106,10 +125,12 @@ def parse(xml_path):
                     dip_count = int(ic_config.find("dipCount").text)
                     raw_spice = textwrap.dedent(ic_config.find("rawSpice").text)
                     spice_nodes = tuple(ic_config.find("spiceNodes").text.split(" "))
+                    logic_model = ic_config.find("logicModel")
+                    logic_model = textwrap.dedent(logic_model.text) if logic_model is not None else ""
                     datasheet = ic_config.find("datasheet").text
 
                     ic = (part_name, part_desc, part_texture, part_picture, dip_count, raw_spice, spice_nodes,
-                          datasheet), IntegratedCircuit
+                          logic_model, datasheet), IntegratedCircuit
                     ics[part_uid] = ic
 
                 # If the part is an LED, add it to the electronics list
@@ -134,6 +155,18 @@ def parse(xml_path):
                            latch, datasheet), Switch
                     electronics[part_uid] = ele
 
+                # If the part is a clock generator, add it to the IC list
+                if part_type == "clock":
+                    clock_config = part.find("clockConfig")
+                    dip_count = int(clock_config.find("dipCount").text)
+                    spice_nodes = tuple(clock_config.find("spiceNodes").text.split(" "))
+                    frequency = float(clock_config.find("frequency").text)
+                    datasheet = clock_config.find("datasheet").text
+
+                    clock = (part_name, part_desc, part_texture, part_picture, dip_count, spice_nodes, frequency,
+                             datasheet), Clock
+                    ics[part_uid] = clock
+
             except TypeError:
                 continue
 
@@ -189,10 +222,12 @@ class Part:
         self.name = name
         self.desc = desc
         self.texture_name, self.preview_texture_name = texture, preview_texture
-        self.texture = pygame.image.load(os.path.join(path, 'assets', 'textures', 'parts', texture))
-        self.texture = self.texture.convert_alpha()
-        self.preview_texture = pygame.image.load(os.path.join(path, 'assets', 'textures', 'parts', preview_texture))
-        self.preview_texture = self.preview_texture.convert_alpha()
+        self.texture, self.preview_texture = None, None
+        if not env.headless:
+            self.texture = pygame.image.load(os.path.join(path, 'assets', 'textures', 'parts', texture))
+            self.texture = self.texture.convert_alpha()
+            self.preview_texture = pygame.image.load(os.path.join(path, 'assets', 'textures', 'parts', preview_texture))
+            self.preview_texture = self.preview_texture.convert_alpha()
         self.env = env
 
 
@@ -214,6 +249,7 @@ class PowerSupply(Part):
         self.rects = [pygame.Rect(pos_rect_tl, rect_wh), pygame.Rect(neg_rect_tl, rect_wh)]
         self.points = [BreadboardPoint(self, Discriminator(0, 0, 0, 1, "main"), Node(), self.rects[0]),
                        BreadboardPoint(self, Discriminator(0, 0, 0, 0, "main"), Sink(), self.rects[1])]
+        self.drawn = None
 
     def __getstate__(self):
         """Return state values to be pickled."""
@@ -224,9 +260,11 @@ class PowerSupply(Part):
         """Restore state from the unpickled state values."""
         self.__init__(*state, pygame.env)
 
-    # Return a surface containing the power supply texture
+    # Return a surface containing the power supply texture. What was drawn on it is kept, so that its scaled surface
+    # can be reused while it stays the same
     def surface(self, real_pos, scale):
         rect_hovered = None
+        drawn = []
         surface = self.texture.copy()
         incomplete_wire = any(isinstance(x, BreadboardPoint) for x in self.env.query_disable)
         if not len(self.env.query_disable) or incomplete_wire:
@@ -235,22 +273,30 @@ class PowerSupply(Part):
             surface_rect.h *= scale[1]
             surface_rect.topleft = real_pos
             if surface_rect.collidepoint(pygame.mouse.get_pos()):
-                for i, rect in enumerate(self.rects):
-                    r = rect.copy()
-                    real_r_pos = tuple(map(sum, zip(real_pos, (r.x * scale[0], r.y * scale[1]))))
-                    r.w *= scale[0]
-                    r.h *= scale[1]
-                    r.topleft = real_r_pos
-                    if r.collidepoint(pygame.mouse.get_pos()):
-                        rect_hovered = self.points[i]
-                        pygame.draw.rect(surface, COL_BLACK, rect)
+                hovered = self.point_at(real_pos, scale)
+                if hovered is not None:
+                    rect, rect_hovered = hovered
+                    pygame.draw.rect(surface, COL_BLACK, rect)
+                    drawn.append(("point", tuple(rect)))
                 pygame.draw.rect(surface, COL_SELECTED, self.texture.get_rect(), width=math.floor(2 / scale[0]))
+                drawn.append("hovered")
                 if pygame.mouse.get_pressed()[0] and rect_hovered is None and not incomplete_wire:
                     self.env.selected = self
         if self.env.selected == self:
             pygame.draw.rect(surface, COL_SELECTED, self.texture.get_rect(), width=math.floor(4 / scale[0]))
+            drawn.append("selected")
+        self.drawn = tuple(drawn)
         return surface, rect_hovered
 
+    # Return the rect on the texture and the point of the terminal under the mouse, when the power supply is drawn at
+    # the given position and scale, or None if the mouse is not over a terminal
+    def point_at(self, real_pos, scale):
+        position = texture_position(real_pos, scale)
+        for i, rect in enumerate(self.rects):
+            if rect.collidepoint(position):
+                return rect, self.points[i]
+        return None
+
 
 class Breadboard(Part):
     """A breadboard structure contains a large array of breadboard points that can be interfaced with to connect
@@ -267,8 +313,16 @@ class Breadboard(Part):
         self.plugins = {} if plugins is None else plugins
         self.main_board_rects, self.main_rails = self.create_rects(main, "main")
         self.pr_rects, self.pr_rails = self.create_rects(power_rail, "power")
-        self.plain_surface = pygame.Surface(self.texture.get_size())
-        self.drawing_surface = self.texture.copy()
+        self.plain_surface, self.drawing_surface = None, None
+        self.drawn, self.drawn_leds = None, None
+        if not env.headless:
+            self.plain_surface = pygame.Surface(self.texture.get_size())
+            self.drawing_surface = self.texture.copy()
+
+            # The holes never change, so they are drawn once onto the texture that is restored before every frame
+            for rect_group in [self.main_board_rects, self.pr_rects]:
+                for rect, _, _ in rect_group.values():
+                    pygame.draw.circle(self.drawing_surface, COL_BREADBOARD_HOLE, rect.center, self.radius)
 
     def __getstate__(self):
         """Return state values to be pickled."""
@@ -371,11 +425,11 @@ class Breadboard(Part):
 
     # Check if an IC will collide with other elements on a breadboard given the coordinate
     def ic_collision(self, ic_discrim, ic_dips):
-        requirements = [i.uuid for i in self.ic_requirements(ic_discrim, ic_dips).values()]
+        requirements = set(self.ic_requirements(ic_discrim, ic_dips).values())
         for plugin in self.plugins.values():
             if isinstance(plugin, IntegratedCircuit):
                 for node in plugin.pins_to_nodes.values():
-                    if node.uuid in requirements:
+                    if node in requirements:
                         return True
         return False
 
@@ -393,33 +447,71 @@ class Breadboard(Part):
 
     # Convert from a position to a coordinate and scale
     def point_to_coord(self, real_pos, point, scale):
-        for rect_group in [self.main_board_rects, self.pr_rects]:
-            for coord in rect_group:
-                p = rect_group[coord][2]
-                if p == point:
-                    r = rect_group[coord][0].copy()
-                    real_r_pos = tuple(map(sum, zip(real_pos, (r.centerx * scale[0], r.centery * scale[1]))))
-                    return real_r_pos
-        return 0, 0
-
-    # Return a surface that only contains the LED bulb heads
+        if point.parent is not self:
+            return 0, 0
+        return real_pos[0] + point.rect.centerx * scale[0], real_pos[1] + point.rect.centery * scale[1]
+
+    # Return the discriminator of the point whose hole contains a pixel of the texture, or None. The holes of each
+    # group lie on a regular grid, so the hole is worked out from the pixel rather than found by testing every hole
+    def hole_at(self, position):
+        for rect_group, board_config, name in [(self.main_board_rects, self.main_board_config, "main"),
+                                               (self.pr_rects, self.pr_config, "power")]:
+            if board_config is None:
+                continue
+
+            # Measure from the corner of the first hole, as every other hole is a whole number of gaps away from it
+            first = rect_group[Discriminator(0, 0, 0, 0, name)][0]
+            x, y = position[0] - first.left, position[1] - first.top
+            segment = min(max(y // board_config.segment_gap, 0), 1)
+            rep = 0
+            if board_config.per_segment_rep_gap:
+                rep = min(max(x // board_config.per_segment_rep_gap, 0), board_config.per_segment_rep_count - 1)
+            column = (x - rep * board_config.per_segment_rep_gap) // self.inch_tenth
+            row = (y - segment * board_config.segment_gap) // self.inch_tenth
+            if 0 <= column < board_config.per_segment_columns and 0 <= row < board_config.per_column_rows:
+                return Discriminator(segment, rep, column, row, name)
+        return None
+
+    # Return the rect on the texture and the point of the hole under the mouse, when the breadboard is drawn at the
+    # given position and scale, or None if the mouse is not over a hole
+    def point_at(self, real_pos, scale):
+        coord = self.hole_at(texture_position(real_pos, scale))
+        if coord is None:
+            return None
+        rect, _, point = (self.main_board_rects if coord.name == "main" else self.pr_rects)[coord]
+        return rect, point
+
+    # Return where the surface of a plugin is drawn on the texture. Integrated circuits are snapped to the centre of
+    # their point, and other plugins are centred on it
+    def plugin_position(self, plugin, plugin_surf):
+        if isinstance(self.plugins[plugin], IntegratedCircuit):
+            return plugin.rect.left, plugin.rect.centery
+        return plugin.rect.centerx - plugin_surf.get_width()/2, plugin.rect.centery - plugin_surf.get_height()/2
+
+    # Return a surface that only contains the LED bulb heads. The state of the LEDs drawn on it is kept, so that its
+    # scaled surface can be reused while they stay the same
     def surface_led(self):
         surface = self.plain_surface.copy()
         surface.set_colorkey((0, 0, 0))
+        drawn = []
         for plugin in self.plugins:
             plugin_obj = self.plugins[plugin]
             if isinstance(plugin_obj, LED):
+                drawn.append((plugin.discriminator, plugin_obj.name, plugin_obj.state, plugin_obj.alive))
                 plugin_rect = plugin.rect
                 plugin_surf = plugin_obj.surface(self)[0]
                 plugin_size = plugin_surf.get_width(), plugin_surf.get_height()
                 plugin_pos = (plugin_rect.centerx - plugin_size[0] / 2, plugin_rect.centery - plugin_size[1] / 2)
                 surface.blit(plugin_surf, plugin_pos)
+        self.drawn_leds = tuple(drawn)
         return surface
 
-    # Return a surface that contains all plugin parts on the part texture
+    # Return a surface that contains all plugin parts on the part texture. What was drawn on it is kept, so that its
+    # scaled surface can be reused while it stays the same
     def surface(self, real_pos, scale):
 
         rect_hovered = None
+        drawn = []
 
         # Prepare the surface
         self.texture.blit(self.drawing_surface, (0, 0))
@@ -433,16 +525,12 @@ class Breadboard(Part):
             plugin_obj = self.plugins[plugin]
             plugin_rect = plugin.rect
             plugin_surf = plugin_obj.surface(self)[0]
-            plugin_size = plugin_surf.get_width(), plugin_surf.get_height()
-
-            # Snap plugin to center if it is an Integrated Circuit
-            if isinstance(plugin_obj, IntegratedCircuit):
-                plugin_pos = (plugin_rect.left, plugin_rect.centery)
-            else:
-                plugin_pos = (plugin_rect.centerx - plugin_size[0]/2, plugin_rect.centery - plugin_size[1]/2)
+            plugin_pos = self.plugin_position(plugin, plugin_surf)
 
             # Draw plugin
             surface.blit(plugin_surf, plugin_pos)
+            drawn.append((plugin.discriminator, plugin_obj.name, getattr(plugin_obj, "state", None),
+                          getattr(plugin_obj, "alive", None)))
 
             # Check if the plugin is hovered with the mouse
             if not len(self.env.query_disable) or self.env.query_disable == [plugin_rect]:
@@ -454,6 +542,7 @@ class Breadboard(Part):
                     if plugin_rect not in self.env.query_disable:
                         self.env.query_disable.append(plugin_rect)
                     pygame.draw.rect(surface, COL_SELECTED, plugin_surf.get_rect(topleft=plugin_pos), width=math.floor(2 / scale[0]))
+                    drawn.append(("hovered", plugin.discriminator))
                     if pygame.mouse.get_pressed()[0]:
                         if incomplete_wire is False:
                             plugin_obj.deletion_key = self, plugin
@@ -471,6 +560,7 @@ class Breadboard(Part):
             # Draw an outline if the plugin is selected
             if self.env.selected == plugin_obj:
                 pygame.draw.rect(surface, COL_SELECTED, plugin_surf.get_rect(topleft=plugin_pos), width=math.floor(4 / scale[0]))
+                drawn.append(("selected", plugin.discriminator))
 
         # Check if the breadboard is hovered
         if not len(self.env.query_disable) or incomplete_wire:
@@ -480,30 +570,27 @@ class Breadboard(Part):
             surface_rect.h *= scale[1]
             surface_rect.topleft = real_pos
 
-            # Find a hovered point
-            for rect_group in [self.main_board_rects, self.pr_rects]:
-                for coord in rect_group:
-                    pygame.draw.circle(surface, COL_BREADBOARD_HOLE, rect_group[coord][0].center, self.radius)
-                    if surface_rect.collidepoint(pygame.mouse.get_pos()):
-                        r = rect_group[coord][0].copy()
-                        real_r_pos = tuple(map(sum, zip(real_pos, (r.x * scale[0], r.y * scale[1]))))
-                        r.w *= scale[0]
-                        r.h *= scale[1]
-                        r.topleft = real_r_pos
-                        if r.collidepoint(pygame.mouse.get_pos()):
-                            rect_hovered = rect_group[coord][2]
-                            pygame.draw.rect(surface, COL_BLACK, rect_group[coord][0])
+            # Find a hovered point, which is the only hole drawn over the texture
+            if surface_rect.collidepoint(pygame.mouse.get_pos()):
+                hovered = self.point_at(real_pos, scale)
+                if hovered is not None:
+                    rect, rect_hovered = hovered
+                    pygame.draw.rect(surface, COL_BLACK, rect)
+                    drawn.append(("point", tuple(rect)))
 
             # Draw an outline around breadboard if hovered
             if surface_rect.collidepoint(pygame.mouse.get_pos()):
                 pygame.draw.rect(surface, COL_SELECTED, self.texture.get_rect(), width=2)
+                drawn.append("hovered")
                 if pygame.mouse.get_pressed()[0] and rect_hovered is None and not incomplete_wire:
                     self.env.selected = self
 
         # Draw an outline around breadboard if selected
         if self.env.selected == self:
             pygame.draw.rect(surface, COL_SELECTED, self.texture.get_rect(), width=4)
+            drawn.append("selected")
 
+        self.drawn = tuple(drawn)
         return surface, rect_hovered
 
 
@@ -558,10 +645,13 @@ class LED(PluginPart):
         """Restore state from the unpickled state values."""
         self.__init__(*state[:-2], pygame.env, anode_point=state[-2], cathode_point=state[-1])
 
-    # Draw the LED
+    # Return a surface containing the LED, which is only drawn again when its state changes
     def surface(self, hovered_board):
+        key = (type(self), self.name, self.on_colour, self.off_colour, self.alive, self.state, hovered_board.inch_tenth)
+        return plugin_surface(key, lambda: self.draw(hovered_board.inch_tenth)), None
 
-        inch_tenth = hovered_board.inch_tenth
+    # Draw the LED
+    def draw(self, inch_tenth):
 
         # Prepare the surface
         surface = pygame.Surface((inch_tenth*2, inch_tenth*2))
@@ -579,29 +669,35 @@ class LED(PluginPart):
         elif self.state:
             pygame.draw.circle(surface, self.on_colour, surface.get_rect().center, math.floor(3*(inch_tenth/4)))
 
-        return surface, None
+        return surface
 
 
 class IntegratedCircuit(PluginPart):
     """The integrated circuit is a structure containing the number of points it occupies, the related subcircuit
-    raw SPICE data and any relevant documentation."""
+    raw SPICE data, its behavioural logic model and any relevant documentation."""
 
-    def __init__(self, name, desc, texture, preview_texture, dip_count, raw_spice, spice_nodes, datasheet_img, env, pin_map=None):
+    def __init__(self, name, desc, texture, preview_texture, dip_count, raw_spice, spice_nodes, logic_model, datasheet_img, env, pin_map=None):
         super().__init__(name, desc, texture, preview_texture, env)
         path = env.get_main_path()
         self.dip_count = dip_count
         self.raw_spice = raw_spice
         self.spice_nodes = spice_nodes
+        self.logic_model = logic_model
         self.datasheet_file = datasheet_img
-        self.datasheet_image = pygame.image.load(os.path.join(path, 'assets', 'textures', 'datasheets', datasheet_img))
+        self.datasheet_image = None
+        if not env.headless:
+            self.datasheet_image = pygame.image.load(os.path.join(path, 'assets', 'textures', 'datasheets', datasheet_img))
         self.pins_to_nodes = {} if pin_map is None else pin_map
 
     def __getstate__(self):
         """Return state values to be pickled."""
-        return self.name, self.desc, self.texture_name, self.preview_texture_name, self.dip_count, self.raw_spice, self.spice_nodes, self.datasheet_file, self.pins_to_nodes
+        return self.name, self.desc, self.texture_name, self.preview_texture_name, self.dip_count, self.raw_spice, self.spice_nodes, self.logic_model, self.datasheet_file, self.pins_to_nodes
 
     def __setstate__(self, state):
         """Restore state from the unpickled state values."""
+        # Projects saved before logic models existed do not have one, so they are only simulated with SPICE
+        if len(state) == 9:
+            state = state[:7] + ("",) + state[7:]
         self.__init__(*state[:-1], pygame.env, pin_map=state[-1])
 
     # Return a surface containing the integrated circuit and its labels
@@ -639,13 +735,15 @@ class IntegratedCircuit(PluginPart):
 
         return win
 
-    # Return a surface containing the integrated circuit and its labels
+    # Return a surface containing the integrated circuit and its labels, which is drawn once for each type of chip and
+    # breadboard. A switch is drawn again when it is toggled
     def surface(self, hovered_board):
         main_board_config = hovered_board.main_board_config
         inch_tenth, radius = hovered_board.inch_tenth, hovered_board.radius
         gap = main_board_config.segment_gap - (main_board_config.per_column_rows*inch_tenth)
-        surface = self.draw(inch_tenth, radius, gap)
-        return surface, None
+        key = (type(self), self.name, self.dip_count, tuple(self.spice_nodes), getattr(self, "state", None), inch_tenth,
+               radius, gap)
+        return plugin_surface(key, lambda: self.draw(inch_tenth, radius, gap)), None
 
 
 class Switch(IntegratedCircuit):
@@ -653,7 +751,7 @@ class Switch(IntegratedCircuit):
     same rules when connecting to a breadboard"""
 
     def __init__(self, name, desc, texture, preview_texture, dip_count, raw_spice, spice_nodes, latch, datasheet_img, env, pin_map=None):
-        super().__init__(name, desc, texture, preview_texture, dip_count, raw_spice, spice_nodes, datasheet_img, env, pin_map=pin_map)
+        super().__init__(name, desc, texture, preview_texture, dip_count, raw_spice, spice_nodes, "", datasheet_img, env, pin_map=pin_map)
         self.state = 0
         self.latch = latch
         self.raw_spice = ""
@@ -699,3 +797,54 @@ class Switch(IntegratedCircuit):
                 pygame.draw.rect(win, COL_IC_PIN, r)
 
         return win
+
+
+class Clock(IntegratedCircuit):
+    """The clock generator is an oscillator which drives its output pin high and low at a fixed frequency while it is
+    powered. It acts as an integrated circuit so that it uses the same rules when connecting to a breadboard"""
+
+    def __init__(self, name, desc, texture, preview_texture, dip_count, spice_nodes, frequency, datasheet_img, env, pin_map=None):
+        super().__init__(name, desc, texture, preview_texture, dip_count, "", spice_nodes, "", datasheet_img, env, pin_map=pin_map)
+        self.frequency = frequency
+
+    def __getstate__(self):
+        """Return state values to be pickled."""
+        return self.name, self.desc, self.texture_name, self.preview_texture_name, self.dip_count, self.spice_nodes, \
+            self.frequency, self.datasheet_file, self.pins_to_nodes
+
+    def __setstate__(self, state):
+        """Restore state from the unpickled state values."""
+        self.__init__(*state[:-1], pygame.env, pin_map=state[-1])
+
+
+# For every wire of a project, update the references such that when loaded from a save state,
+# the wire correctly simulates a connection between regenerated nodes
+def rejuvenate_wires(wires):
+    for wire in wires:
+        old_point_a_group = wire.point_a.discriminator.name
+        group_1 = None
+        if isinstance(wire.point_a.parent, PowerSupply):
+            if wire.point_a.discriminator.row:
+                wire.point_a = wire.point_a.parent.points[0]
+            else:
+                wire.point_a = wire.point_a.parent.points[1]
+        elif isinstance(wire.point_a.parent, Breadboard):
+            if old_point_a_group == "main":
+                group_1 = wire.point_a.parent.main_board_rects
+            elif old_point_a_group == "power":
+                group_1 = wire.point_a.parent.pr_rects
+            wire.point_a = group_1[wire.point_a.discriminator][2]
+
+        old_point_b_group = wire.point_b.discriminator.name
+        group_2 = None
+        if isinstance(wire.point_b.parent, PowerSupply):
+            if wire.point_b.discriminator.row:
+                wire.point_b = wire.point_b.parent.points[0]
+            else:
+                wire.point_b = wire.point_b.parent.points[1]
+        elif isinstance(wire.point_b.parent, Breadboard):
+            if old_point_b_group == "main":
+                group_2 = wire.point_b.parent.main_board_rects
+            elif old_point_b_group == "power":
+                group_2 = wire.point_b.parent.pr_rects
+            wire.point_b = group_2[wire.point_b.discriminator][2]
@@ -0,0 +1,559 @@
+import PySpice.Spice.NgSpice.Shared
+
+from collections import namedtuple
+from PySpice.Spice.Netlist import Circuit
+
+from logic.cache import cache_key
+from logic.digital import DigitalEngine, DigitalError, FloatingInputError
+from logic.electronics import ICSpiceSubCircuit
+from logic.erc import check, floating_messages, summarise
+from logic.mna import MNASolver, SolverError
+from logic.parts import PowerSupply, Breadboard, IntegratedCircuit, LED, Switch, Clock
+from logic.spice import SpiceSession
+
+
+# Named tuples for readable code
+SupplySource = namedtuple("SupplySource", "name positive negative voltage")
+ICInstance = namedtuple("ICInstance", "name part raw_spice spice_nodes logic_model pins")
+Diode = namedtuple("Diode", "name anode cathode alive")
+Resistor = namedtuple("Resistor", "name a b resistance")
+SwitchContact = namedtuple("SwitchContact", "name a b closed")
+ClockSource = namedtuple("ClockSource", "name output vcc gnd frequency")
+SimulationResult = namedtuple("SimulationResult", "node_analysis led_states warning samples", defaults=({},))
+
+# Resistance of a switch contact, so that toggling a switch only alters values in the virtual circuit
+SWITCH_CLOSED = 1e-3
+SWITCH_OPEN = 1e12
+
+# Subcircuits built for each type of chip, kept between frames so that each is only built once
+subcircuits = {}
+
+# Warnings shown to the user when the simulation finds a problem
+FLOATING_WARNING = "Oops! Looks like one of your electrical components has floating input/s " \
+                   "(not connected). Check to make sure ALL inputs are plugged in, even if they are" \
+                   " not in use! You may have also shorted your power supply."
+CLOCK_WARNING = "Clocks can only be simulated in circuits made of logic chips, LEDs, resistors and switches. " \
+                "Remove the clock to simulate this circuit."
+DEAD_LED_WARNING = "An LED has received too much voltage/current and has died " \
+                   "(indicated by an X on the LED). Please replace it and use a resistor to limit the current."
+ERROR_WARNING = "Oops! The simulator ran into an error while solving this circuit. " \
+                "Change the circuit to try simulating it again."
+
+
+# Return the subcircuit of the type of a chip, which is defined once per circuit along with the models and inner
+# subcircuits of its raw SPICE, and instantiated for every chip of that type
+def part_subcircuit(ic):
+    key = (ic.part, ic.raw_spice, ic.spice_nodes)
+    if key not in subcircuits:
+        subcircuits[key] = ICSpiceSubCircuit(ic.part, ic.raw_spice, ic.spice_nodes)
+    return subcircuits[key]
+
+
+class Netlist:
+    """The netlist is a plain description of every electrical element in a project, where each terminal is given the
+    name of the net it is connected to. It can be fingerprinted to check if the circuit has changed, and converted
+    into a virtual SPICE circuit to be simulated. Elements are labelled by where they are on the bench, and the wires
+    shorting each shorted power supply are described, so that warnings can point the user to them."""
+
+    def __init__(self):
+        self.supplies = []
+        self.ics = []
+        self.switches = []
+        self.diodes = []
+        self.resistors = []
+        self.clocks = []
+        self.goes_to_gnd = []
+        self.labels = {}
+        self.shorts = {}
+
+    def __len__(self):
+        return len(self.supplies) + len(self.ics) + len(self.switches) + len(self.diodes) + len(self.resistors) + \
+            len(self.clocks)
+
+    # Return every net of the netlist in order of first appearance
+    def nets(self):
+        nets = [j for i in self.supplies for j in (i.positive, i.negative)]
+        nets += [j for i in self.ics for j in i.pins]
+        nets += [j for i in self.switches for j in (i.a, i.b)]
+        nets += [j for i in self.diodes for j in (i.anode, i.cathode)]
+        nets += [j for i in self.resistors for j in (i.a, i.b)]
+        nets += [j for i in self.clocks for j in (i.output, i.vcc, i.gnd)]
+        return list(dict.fromkeys(nets + self.goes_to_gnd))
+
+    # Return a copy of the netlist where every net is renamed by the given names
+    def rename(self, names):
+        netlist = Netlist()
+        netlist.supplies = [i._replace(positive=names[i.positive], negative=names[i.negative]) for i in self.supplies]
+        netlist.ics = [i._replace(pins=tuple(names[j] for j in i.pins)) for i in self.ics]
+        netlist.switches = [i._replace(a=names[i.a], b=names[i.b]) for i in self.switches]
+        netlist.diodes = [i._replace(anode=names[i.anode], cathode=names[i.cathode]) for i in self.diodes]
+        netlist.resistors = [i._replace(a=names[i.a], b=names[i.b]) for i in self.resistors]
+        netlist.clocks = [i._replace(output=names[i.output], vcc=names[i.vcc], gnd=names[i.gnd]) for i in self.clocks]
+        netlist.goes_to_gnd = [names[i] for i in self.goes_to_gnd]
+        netlist.labels = self.labels
+        netlist.shorts = self.shorts
+        return netlist
+
+    # Return the names of the nets in a canonical netlist, which are numbered in order of first appearance so that two
+    # netlists built from the same circuit are equal regardless of the random names given to their nets
+    def canonical_names(self):
+        nets = [net for net in self.nets() if net != "gnd"]
+        return dict({net: f"n{index}" for index, net in enumerate(nets, 1)}, gnd="gnd")
+
+    # Return a copy of the netlist where the nets are renamed in order of first appearance
+    def canonical(self):
+        return self.rename(self.canonical_names())
+
+    # Split the netlist into its electrically independent components, which only share ground. Return each component
+    # with the indices of its diodes in this netlist, so that their LED states can be put back in order
+    def components(self):
+        parent = {}
+
+        def find(net):
+            parent.setdefault(net, net)
+            while parent[net] != net:
+                parent[net] = parent[parent[net]]
+                net = parent[net]
+            return net
+
+        elements = [("supplies", i, (i.positive, i.negative)) for i in self.supplies]
+        elements += [("ics", i, i.pins) for i in self.ics]
+        elements += [("switches", i, (i.a, i.b)) for i in self.switches]
+        elements += [("diodes", i, (i.anode, i.cathode)) for i in self.diodes]
+        elements += [("resistors", i, (i.a, i.b)) for i in self.resistors]
+        elements += [("clocks", i, (i.output, i.vcc, i.gnd)) for i in self.clocks]
+        for _, _, terminals in elements:
+            terminals = [net for net in terminals if net != "gnd"]
+            for net in terminals[1:]:
+                parent[find(net)] = find(terminals[0])
+
+        # Elements connected only to ground are put together in a component of their own
+        components = {}
+        for index, (kind, element, terminals) in enumerate(elements):
+            root = next((find(net) for net in terminals if net != "gnd"), "gnd")
+            component, diodes = components.setdefault(root, (Netlist(), []))
+            getattr(component, kind).append(element)
+            if element.name in self.labels:
+                component.labels[element.name] = self.labels[element.name]
+            if kind == "supplies" and element.name in self.shorts:
+                component.shorts[element.name] = self.shorts[element.name]
+            if kind == "diodes":
+                diodes.append(index - len(self.supplies) - len(self.ics) - len(self.switches))
+        for net in self.goes_to_gnd:
+            if find(net) in components:
+                components[find(net)][0].goes_to_gnd.append(net)
+        return list(components.values())
+
+    # Return a hashable description of the topology, resistances, switch states and supply voltages of the circuit,
+    # and of the labels which are named in its warnings
+    def fingerprint(self):
+        return tuple(self.supplies), tuple(self.ics), tuple(self.switches), tuple(self.diodes), tuple(self.resistors), \
+            tuple(self.clocks), tuple(self.labels.items()), tuple(self.shorts.items())
+
+    # Return a hashable description of how the elements are connected, ignoring any values that can be altered
+    def topology(self):
+        supplies = tuple(i[:-1] for i in self.supplies)
+        switches = tuple(i[:-1] for i in self.switches)
+        diodes = tuple(i[:-1] for i in self.diodes)
+        resistors = tuple(i[:-1] for i in self.resistors)
+        return supplies, tuple(self.ics), switches, diodes, resistors, tuple(self.clocks)
+
+    # Return the alterable parameter of every SPICE device, keyed by device name
+    def values(self):
+        values = {}
+        for supply in self.supplies:
+            values[f'V{supply.name}'] = ('dc', supply.voltage)
+        for switch in self.switches:
+            values[f'RS{switch.name}'] = ('resistance', SWITCH_CLOSED if switch.closed else SWITCH_OPEN)
+        for resistor in self.resistors:
+            values[f'R{resistor.name}'] = ('resistance', resistor.resistance)
+        return values
+
+    # Create a virtual SPICE circuit containing every element of the netlist
+    def circuit(self):
+        circuit = Circuit("dev", ground="gnd")
+
+        # IS = Saturated Current, RS = Ohmic Parasitic Resistance, N = Emission Coefficient
+        circuit.model('LED', 'D', IS=1e-19, N=1.6, RS=2.5, EG=2.1)
+
+        for supply in self.supplies:
+            circuit.V(supply.name, supply.positive, supply.negative, supply.voltage)
+        for ic in self.ics:
+            subcircuit = part_subcircuit(ic)
+            circuit.subcircuit(subcircuit)
+            circuit.X(ic.name, subcircuit.name, *ic.pins)
+        for switch in self.switches:
+            circuit.R(f'S{switch.name}', switch.a, switch.b, SWITCH_CLOSED if switch.closed else SWITCH_OPEN)
+        for diode in self.diodes:
+            circuit.Diode(diode.name, diode.anode, diode.cathode, model='LED')
+        for resistor in self.resistors:
+            circuit.R(resistor.name, resistor.a, resistor.b, resistor.resistance)
+
+        return circuit
+
+
+# Describe where a breadboard point or power supply terminal is, for warnings shown to the user
+def describe(point):
+    if isinstance(point.parent, PowerSupply):
+        terminal = "positive" if point is point.parent.points[0] else "negative"
+        return f"the {terminal} terminal of the {point.parent.name}"
+    if point.discriminator.name == "power":
+        return f"the power rail at column {point.discriminator.column + 1}"
+    return f"column {point.discriminator.column + 1}, row {point.discriminator.row + 1}"
+
+
+# Describe the wires on the shortest chain of links shorting a power supply, which are joined to the positive
+# terminal by wires or the internal links of switches
+def describe_short(supply, nets, wires):
+    path = nets.path_to_sink(supply.points[0].common)
+    shorting = [wires[link] for link in zip(path, path[1:]) if link in wires]
+    return " and the ".join(f"wire from {describe(i.point_a)} to {describe(i.point_b)}" for i in shorting)
+
+
+# Find every electrical element in the project and describe it in a netlist, using the net table of the project to
+# name the net of each node unless another table is given. The LEDs which are simulated are returned in the same order
+# as the diodes of the netlist
+def build_netlist(project, nets=None):
+    nets = project.nets if nets is None else nets
+    netlist = Netlist()
+    displays = []
+
+    # Find all power supplies and breadboards in the project
+    supplies = [supply for supply in project.boards.values() if isinstance(supply, PowerSupply)]
+    boards = [board for board in project.boards.values() if isinstance(board, Breadboard)]
+
+    # Join the nodes connected by wires and by the internal links of switches into nets
+    links, wires = [], {}
+    for wire in project.wires:
+        if wire.resistance == 0:
+            links.append((wire.point_a.common, wire.point_b.common))
+            wires[wire.point_a.common, wire.point_b.common] = wires[wire.point_b.common, wire.point_a.common] = wire
+    for board in boards:
+        for plugin_object in board.plugins.values():
+            if isinstance(plugin_object, Switch):
+                pins_to_nodes = plugin_object.pins_to_nodes
+                links.append((pins_to_nodes[0], pins_to_nodes[5]))
+                links.append((pins_to_nodes[1], pins_to_nodes[4]))
+                links.append((pins_to_nodes[2], pins_to_nodes[3]))
+    nets.sync(links)
+
+    # Create voltage sources
+    for supply in supplies:
+        name = nets.name(supply)
+        positive, negative = nets.net(supply.points[0].common), nets.net(supply.points[1].common)
+        netlist.supplies.append(SupplySource(name, positive, negative, supply.voltage))
+        netlist.labels[name] = supply.name
+        if positive == negative:
+            netlist.shorts[name] = describe_short(supply, nets, wires)
+
+    # Create ICs and Electronics. Each part is named by the net table, so its name stays the same when other parts
+    # are added or removed, and components which did not change keep their fingerprints
+    for board in boards:
+        for plugin in board.plugins:
+            plugin_object = board.plugins[plugin]
+            name = nets.name(plugin_object)
+            label = f"{plugin_object.name} at column {plugin.discriminator.column + 1}"
+            if isinstance(plugin_object, Switch):
+                pins_to_nodes = plugin_object.pins_to_nodes
+                common, throw_a, throw_b = (nets.net(pins_to_nodes[i]) for i in (1, 0, 2))
+                contacts = (SwitchContact(f'{name}a', common, throw_a, not plugin_object.state),
+                            SwitchContact(f'{name}b', common, throw_b, bool(plugin_object.state)))
+                for contact in contacts:
+                    netlist.switches.append(contact)
+                    netlist.labels[contact.name] = label
+                    if contact.closed and contact.a == "gnd":
+                        netlist.goes_to_gnd.append(contact.b)
+                    if contact.closed and contact.b == "gnd":
+                        netlist.goes_to_gnd.append(contact.a)
+            if isinstance(plugin_object, Clock):
+                pins = dict(zip(plugin_object.spice_nodes, plugin_object.pins_to_nodes.values()))
+                netlist.clocks.append(ClockSource(name, nets.net(pins["OUT"]), nets.net(pins["vcc"]),
+                                                  nets.net(pins["gnd"]), plugin_object.frequency))
+                netlist.labels[name] = label
+            if isinstance(plugin_object, IntegratedCircuit) and not isinstance(plugin_object, (Switch, Clock)):
+                pins_to_nodes = tuple(nets.net(i) for i in plugin_object.pins_to_nodes.values())
+                netlist.ics.append(ICInstance(name, plugin_object.name, plugin_object.raw_spice,
+                                              plugin_object.spice_nodes, plugin_object.logic_model, pins_to_nodes))
+                netlist.labels[name] = label
+            if isinstance(plugin_object, LED):
+                if not plugin_object.cathode_connecting:
+                    point_a = nets.net(plugin_object.anode_point.common)
+                    point_b = nets.net(plugin_object.cathode_point.common)
+                    netlist.diodes.append(Diode(name, point_a, point_b, plugin_object.alive))
+                    displays.append(plugin_object)
+
+    # Create resistors, which are named by the net table in the same way as parts
+    for wire in project.wires:
+        if wire.resistance != 0:
+            point_a, point_b = nets.net(wire.point_a.common), nets.net(wire.point_b.common)
+            netlist.resistors.append(Resistor(nets.name(wire), point_a, point_b, int(wire.resistance)))
+            if point_a == "gnd":
+                netlist.goes_to_gnd.append(point_b)
+            if point_b == "gnd":
+                netlist.goes_to_gnd.append(point_a)
+
+    return netlist, displays
+
+
+# Evaluate if every LED of the netlist is receiving the correct power given the node voltages
+# Return the new (state, alive) of each LED
+def evaluate_leds(netlist, node_analysis):
+    led_states = []
+    for diode in netlist.diodes:
+        point_a, point_b = diode.anode, diode.cathode
+        state, alive = 0, diode.alive
+        if alive:
+            if point_a in node_analysis:
+                if 2 >= node_analysis[point_a] >= 1.2 and point_b == "gnd":
+                    state = 1
+                else:
+                    if node_analysis[point_a] > 2:
+                        if point_b == "gnd":
+                            alive = False
+                        elif point_b in node_analysis:
+                            if 2 >= (node_analysis[point_a] - node_analysis[point_b]) >= 1.2:
+                                state = 1
+                            elif (node_analysis[point_a] - node_analysis[point_b]) > 2:
+                                alive = False
+                    elif node_analysis[point_a] >= 1.2:
+                        if point_b in netlist.goes_to_gnd:
+                            state = 1
+        led_states.append((state, alive))
+    return led_states
+
+
+# Simulate the netlist and return the node voltages and LED states. Circuits without chips are solved by the built-in
+# MNA solver, circuits made only of chips with a logic model are simulated by the digital engine, and anything it
+# cannot reduce to logic levels is solved by ngspice
+def solve(netlist, session, digital, mna):
+    result = solve_logic(netlist, digital, mna)
+    if result is None:
+        try:
+            node_analysis = session.operating_point(netlist)
+        except PySpice.Spice.NgSpice.Shared.NgSpiceCommandError:
+            node_analysis = None
+        result = spice_result(netlist, node_analysis)
+    return result
+
+
+# Simulate the netlist without ngspice, returning None if it can only be solved by ngspice
+def solve_logic(netlist, digital, mna):
+    warning = "".join(DEAD_LED_WARNING for diode in netlist.diodes if not diode.alive)
+
+    if len(netlist.clocks):
+        return transient(netlist, digital, 0)
+
+    if not len(netlist.ics):
+        try:
+            node_analysis = mna.operating_point(netlist) if len(netlist) else {}
+        except SolverError:
+            warning = FLOATING_WARNING + warning
+            node_analysis = {}
+        return SimulationResult(node_analysis, evaluate_leds(netlist, node_analysis), warning)
+
+    if all(ic.logic_model for ic in netlist.ics):
+        try:
+            node_analysis = digital.simulate(netlist)
+            return SimulationResult(node_analysis, evaluate_leds(netlist, node_analysis), warning)
+        except FloatingInputError as error:
+            return SimulationResult({}, evaluate_leds(netlist, {}),
+                                    summarise(floating_messages(netlist, error.pins)) + warning)
+        except DigitalError:
+            pass
+    return None
+
+
+# Return the result of the node voltages ngspice found for the netlist, which are None if ngspice could not solve it
+def spice_result(netlist, node_analysis):
+    warning = "".join(DEAD_LED_WARNING for diode in netlist.diodes if not diode.alive)
+    if node_analysis is None:
+        warning = FLOATING_WARNING + warning
+        node_analysis = {}
+    return SimulationResult(node_analysis, evaluate_leds(netlist, node_analysis), warning)
+
+
+# Join canonical netlists into one netlist, so that they can be solved by ngspice as a single circuit. The nets of each
+# netlist are given its position as a prefix, since canonical netlists share net names, and only ground is shared.
+# Return the joined netlist with the names given to the nets of each netlist
+def merge(netlists):
+    merged, renames = Netlist(), []
+    for index, netlist in enumerate(netlists):
+        names = {net: net if net == "gnd" else f"c{index}_{net}" for net in netlist.nets()}
+        renamed = netlist.rename(names)
+        for kind in ("supplies", "ics", "switches", "diodes", "resistors", "clocks", "goes_to_gnd"):
+            getattr(merged, kind).extend(getattr(renamed, kind))
+        renames.append(names)
+    return merged, renames
+
+
+# Simulate a netlist with clocks from the present simulated time for a duration, which can only be done by the
+# digital engine. The result holds the (time, value) of every change of a net level during the duration
+def transient(netlist, digital, duration):
+    warning = "".join(DEAD_LED_WARNING for diode in netlist.diodes if not diode.alive)
+    if not all(ic.logic_model for ic in netlist.ics):
+        return SimulationResult({}, evaluate_leds(netlist, {}), CLOCK_WARNING + warning)
+    try:
+        node_analysis, samples = digital.transient(netlist, duration)
+        return SimulationResult(node_analysis, evaluate_leds(netlist, node_analysis), warning, samples)
+    except FloatingInputError as error:
+        return SimulationResult({}, evaluate_leds(netlist, {}), summarise(floating_messages(netlist, error.pins)) +
+                                warning)
+    except DigitalError:
+        return SimulationResult({}, evaluate_leds(netlist, {}), CLOCK_WARNING + warning)
+
+
+# Split a netlist without clocks into its components and combine their results, which are found by passing each
+# component to a function. Return None if the function has no result for any of them
+def combine(netlist, solve):
+    node_analysis, led_states, warnings = {}, [None] * len(netlist.diodes), {}
+    for component, diodes in netlist.components():
+        # Components are solved with canonical net names, so they are recognised when the rest of the circuit changes
+        # the order in which nets first appear
+        names = component.canonical_names()
+        result = solve(component.rename(names))
+        if result is None:
+            return None
+
+        nets = {canonical: net for net, canonical in names.items()}
+        node_analysis.update((nets.get(net, net), voltage) for net, voltage in result.node_analysis.items())
+        for index, led_state in zip(diodes, result.led_states):
+            led_states[index] = led_state
+        warnings[result.warning.replace(DEAD_LED_WARNING, "")] = None
+
+    warning = "".join(DEAD_LED_WARNING for diode in netlist.diodes if not diode.alive)
+    return SimulationResult(node_analysis, led_states, "".join(warnings) + warning)
+
+
+# Update the state of every simulated LED from a simulation result
+def apply_result(displays, result):
+    for display, (state, alive) in zip(displays, result.led_states):
+        display.state, display.alive = state, alive
+
+
+class Simulation:
+    """The simulation structure converts the project to a netlist on every frame, but only asks ngspice to solve
+    the netlist when its fingerprint differs from the one which was last solved. Otherwise, the node voltages and
+    LED states of the previous solve are reused. Netlists with clocks are instead stepped through simulated time.
+
+    Circuits without clocks are split into their electrically independent components, so a floating input in one
+    component does not stop the others from being simulated. Each component is checked for shorted supplies and
+    floating chip pins before it is solved, so a component which cannot be solved is reported without running the
+    failing solve again on every change. Each component keeps its own digital engine and MNA solver, and only
+    components whose fingerprint has changed are solved again. Components which have been solved before are read from
+    the result cache if one is given.
+
+    There is only one ngspice in the process, so the components which need it are joined into a single circuit for
+    the SPICE session. Changing a value in any of them then alters the loaded circuit rather than reloading it."""
+
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.session = SpiceSession()
+        self.digital = DigitalEngine()
+        self.engines = {}
+        self.results = {}
+        self.spice = set()
+        self.fingerprint = None
+        self.problems = ""
+        self.result = SimulationResult({}, [], "")
+
+    # Solve a canonical netlist, or return the previous result if the netlist has not changed
+    def solve(self, netlist):
+        fingerprint = netlist.fingerprint()
+        if fingerprint != self.fingerprint:
+            if len(netlist.clocks):
+                self.step(netlist, 0)
+            else:
+                self.result = self.solve_components(netlist)
+            self.fingerprint = fingerprint
+        return self.result
+
+    # Solve each component of a netlist without clocks and combine their results. Components which need ngspice are
+    # set aside, and if any of them has changed they are all solved together once every other component has been
+    # solved, so that the circuit loaded in the SPICE session keeps its topology. The results are then combined again
+    def solve_components(self, netlist):
+        engines, results, spice = {}, {}, {}
+
+        def component_result(component):
+            fingerprint, topology = component.fingerprint(), component.topology()
+            engines[topology] = self.engines.get(topology) or engines.get(topology) or (DigitalEngine(), MNASolver())
+            if fingerprint not in results:
+                results[fingerprint] = self.results.get(fingerprint) or self.solve_component(component,
+                                                                                           *engines[topology])
+            if fingerprint in self.spice or results[fingerprint] is None:
+                spice[fingerprint] = component
+            return results[fingerprint] or SimulationResult({}, [], "")
+
+        result = combine(netlist, component_result)
+        if any(results[i] is None for i in spice):
+            results.update(zip(spice, self.solve_spice(list(spice.values()))))
+            result = combine(netlist, component_result)
+        self.engines, self.results, self.spice = engines, results, set(spice)
+        return result
+
+    # Solve a canonical component with its own engines, unless the rule check finds it cannot be solved. Components
+    # which have been solved before are read from the result cache. Return None if the component needs ngspice
+    def solve_component(self, component, digital, mna):
+        problems = check(component)
+        if problems:
+            warning = "".join(DEAD_LED_WARNING for diode in component.diodes if not diode.alive)
+            return SimulationResult({}, evaluate_leds(component, {}), problems + warning)
+
+        if self.cache is None:
+            return solve_logic(component, digital, mna)
+        key = cache_key(component)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return SimulationResult(*cached)
+        result = solve_logic(component, digital, mna)
+        if result is not None:
+            self.store(key, result)
+        return result
+
+    # Solve canonical components as one circuit in the SPICE session and return the result of each. If ngspice cannot
+    # solve the joined circuit, each component is solved alone so that only those which fail are warned about
+    def solve_spice(self, components):
+        merged, renames = merge(components)
+        try:
+            node_analysis = self.session.operating_point(merged)
+            voltages = [{net: node_analysis[name] for net, name in names.items() if name in node_analysis}
+                        for names in renames]
+        except PySpice.Spice.NgSpice.Shared.NgSpiceCommandError:
+            voltages = []
+            for component in components:
+                try:
+                    voltages.append(self.session.operating_point(component))
+                except PySpice.Spice.NgSpice.Shared.NgSpiceCommandError:
+                    voltages.append(None)
+
+        results = [spice_result(component, node_analysis) for component, node_analysis in zip(components, voltages)]
+        if self.cache is not None:
+            for component, result in zip(components, results):
+                self.store(cache_key(component), result)
+        return results
+
+    # Put the result of a component in the result cache. Only solves which succeeded are cached, so a failure of the
+    # solver is tried again rather than kept on disk
+    def store(self, key, result):
+        if not result.warning.replace(DEAD_LED_WARNING, ""):
+            self.cache.put(key, *result[:3])
+
+    # Simulate a canonical netlist with clocks for a duration of simulated time following the previous step, unless
+    # the rule check finds it cannot be simulated
+    def step(self, netlist, duration):
+        fingerprint = netlist.fingerprint()
+        if fingerprint != self.fingerprint:
+            self.problems = check(netlist)
+        if self.problems:
+            warning = "".join(DEAD_LED_WARNING for diode in netlist.diodes if not diode.alive)
+            self.result = SimulationResult({}, evaluate_leds(netlist, {}), self.problems + warning)
+        else:
+            self.result = transient(netlist, self.digital, duration)
+        self.fingerprint = fingerprint
+        return self.result
+
+    # Simulate the project, update the state of every LED and return any warning to be shown
+    def simulate(self, project):
+        netlist, displays = build_netlist(project)
+        result = self.solve(netlist.canonical())
+        apply_result(displays, result)
+        return result.warning
@@ -0,0 +1,78 @@
+import PySpice.Spice.NgSpice.Shared
+
+from PySpice.Spice.NgSpice.Shared import NgSpiceShared
+
+
+class SpiceSession:
+    """The SPICE session keeps a single ngspice instance and circuit loaded for as long as the topology of the project
+    stays the same. Changes to switch positions, resistances and supply voltages are applied to the loaded circuit
+    with alter commands instead of tearing down and reloading the shared library state. The number of operating
+    points asked of the session is counted, so that the soak test can tell the SPICE path was taken."""
+
+    def __init__(self):
+        self.ngspice = None
+        self.simulator = None
+        self.topology = None
+        self.values = {}
+        self.solves = 0
+
+    # Remove the loaded circuit and any stored plots from ngspice
+    def unload(self):
+        if self.simulator is not None:
+            try:
+                self.ngspice.remove_circuit()
+                self.ngspice.destroy()
+            except PySpice.Spice.NgSpice.Shared.NgSpiceCommandError:
+                pass
+        self.simulator = None
+        self.topology = None
+        self.values = {}
+
+    # Load a new circuit into ngspice and run its operating point analysis
+    def load(self, netlist):
+        self.unload()
+        if self.ngspice is None:
+            self.ngspice = NgSpiceShared.new_instance()
+        self.simulator = netlist.circuit().simulator(ngspice_shared=self.ngspice)
+
+        # PySpice raises a plain NameError when the run leaves only the constants plot, which is the same failure as
+        # a rejected command
+        try:
+            analysis = self.simulator.operating_point()
+        except PySpice.Spice.NgSpice.Shared.NgSpiceCommandError:
+            raise
+        except NameError as error:
+            raise PySpice.Spice.NgSpice.Shared.NgSpiceCommandError(str(error)) from error
+        self.topology = netlist.topology()
+        self.values = netlist.values()
+        return analysis
+
+    # Alter the devices of the loaded circuit whose values have changed and rerun the operating point analysis
+    def alter(self, netlist):
+        values = netlist.values()
+        for device, (parameter, value) in values.items():
+            if self.values.get(device) != (parameter, value):
+                self.ngspice.alter_device(device, **{parameter: value})
+        self.values = values
+
+        # Only keep the plot of the latest run in memory
+        self.ngspice.destroy()
+        self.ngspice.run()
+
+        # A run which failed leaves only the constants plot behind
+        if self.ngspice.last_plot == "const":
+            raise PySpice.Spice.NgSpice.Shared.NgSpiceCommandError("Simulation failed")
+        return self.ngspice.plot(self.simulator, self.ngspice.last_plot).to_analysis()
+
+    # Return the voltage of every node in the netlist, reloading the circuit only if the topology has changed
+    def operating_point(self, netlist):
+        self.solves += 1
+        try:
+            if netlist.topology() == self.topology:
+                analysis = self.alter(netlist)
+            else:
+                analysis = self.load(netlist)
+        except PySpice.Spice.NgSpice.Shared.NgSpiceCommandError:
+            self.unload()
+            raise
+        return {str(node): float(value) for node, value in analysis.nodes.items()}
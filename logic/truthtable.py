@@ -0,0 +1,126 @@
+import argparse
+import concurrent.futures
+import csv
+import json
+import multiprocessing
+import os
+import sys
+
+from logic.cache import ResultCache
+from logic.headless import load
+from logic.parts import Breadboard, Switch
+from logic.simulation import Simulation, build_netlist
+
+# The simulation of each worker process, which stays loaded between the rows it solves
+simulation = None
+
+
+# Create the simulation of a worker process, reading rows solved before from the result cache if it is used
+def start_worker(cache=True):
+    global simulation
+    simulation = Simulation(ResultCache() if cache else None)
+
+
+# Solve a run of netlists in a worker process, returning the (state, alive) of every LED and the warning of each
+def solve_rows(netlists):
+    results = []
+    for netlist in netlists:
+        result = simulation.solve(netlist)
+        results.append((result.led_states, result.warning))
+    return results
+
+
+# Return the label of a plugin, given by its name, board and the column of the hole it is plugged into, which is counted
+# from 1 as in the warnings of the rule check
+def label(plugin, board, point):
+    return f"{plugin.name} {board}:{point.discriminator.column + 1}"
+
+
+# Return the switch states of every row of a truth table in gray code order, so that only one switch changes between
+# consecutive rows and each worker can alter its loaded circuit instead of rebuilding it
+def gray_code(count):
+    return [tuple((i ^ (i >> 1)) >> j & 1 for j in reversed(range(count))) for i in range(2 ** count)]
+
+
+# Simulate every combination of switch states in the project across a pool of processes. Return the labels of the
+# switches and LEDs, and a row of switch states, LED states and warning for each combination
+def truth_table(project, processes=None, cache=True):
+    boards = [board for board in project.boards.values() if isinstance(board, Breadboard)]
+    switches, switch_labels = [], []
+    for index, board in enumerate(boards):
+        for point, plugin in board.plugins.items():
+            if isinstance(plugin, Switch):
+                switches.append(plugin)
+                switch_labels.append(label(plugin, index, point))
+
+    # The netlists are built here, as only this process has the project, and the switches are left as they were
+    original = [switch.state for switch in switches]
+    states = gray_code(len(switches))
+    netlists = []
+    try:
+        for row in states:
+            for switch, state in zip(switches, row):
+                switch.state = state
+            netlist, displays = build_netlist(project)
+            netlists.append(netlist.canonical())
+    finally:
+        for switch, state in zip(switches, original):
+            switch.state = state
+    led_labels = [label(led, boards.index(led.anode_point.parent), led.anode_point) for led in displays]
+
+    # Each worker is given one contiguous run of rows
+    processes = min(processes or os.cpu_count() or 1, len(netlists))
+    size = -(-len(netlists) // processes)
+    runs = [netlists[i:i + size] for i in range(0, len(netlists), size)]
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(processes, mp_context=context, initializer=start_worker,
+                                                initargs=(cache,)) as pool:
+        results = [result for run in pool.map(solve_rows, runs) for result in run]
+
+    rows = []
+    for row, (led_states, warning) in sorted(zip(states, results)):
+        leds = tuple("dead" if not alive else "on" if state else "off" for state, alive in led_states)
+        rows.append((row, leds, warning))
+    return switch_labels, led_labels, rows
+
+
+# Write a truth table as CSV, with a column for each switch and LED
+def write_csv(file, switch_labels, led_labels, rows):
+    writer = csv.writer(file)
+    writer.writerow(switch_labels + led_labels + ["warning"])
+    for row, leds, warning in rows:
+        writer.writerow(list(row) + list(leds) + [warning])
+
+
+# Write a truth table as JSON, with an object for each row
+def write_json(file, switch_labels, led_labels, rows):
+    table = [{"switches": dict(zip(switch_labels, row)), "leds": dict(zip(led_labels, leds)), "warning": warning}
+             for row, leds, warning in rows]
+    json.dump({"switches": switch_labels, "leds": led_labels, "rows": table}, file, indent=1)
+    file.write("\n")
+
+
+# Extract the truth table of a project file and write it as CSV or JSON
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m logic.truthtable",
+                                     description="Simulate every combination of switches in a de:volt project")
+    parser.add_argument("project", type=argparse.FileType("rb"), help=".dev project file")
+    parser.add_argument("-o", "--output", default=None,
+                        help="file to write the truth table to, as JSON if it ends in .json and otherwise as CSV")
+    parser.add_argument("-j", "--processes", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--no-cache", action="store_true", help="solve every row instead of reading cached results")
+    args = parser.parse_args(args)
+
+    with args.project:
+        project = load(args.project)
+    table = truth_table(project, args.processes, not args.no_cache)
+    write = write_json if args.output is not None and args.output.endswith(".json") else write_csv
+    if args.output is None:
+        write(sys.stdout, *table)
+    else:
+        with open(args.output, "w", newline="", encoding="utf-8") as file:
+            write(file, *table)
+
+
+if __name__ == "__main__":
+    main()
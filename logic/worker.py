@@ -0,0 +1,291 @@
+import itertools
+import multiprocessing
+import queue
+import time
+import traceback
+
+from logic.cache import ResultCache
+from logic.simulation import ERROR_WARNING, Simulation, SimulationResult, build_netlist, apply_result, combine, \
+    evaluate_leds
+from runtime.scheduler import SIMULATION_RATE, SimulationScheduler
+
+# Simulated time is stepped in chunks of one frame, and never falls further behind the wall clock than this
+TRANSIENT_CHUNK = 1 / 120
+TRANSIENT_MAX_LAG = 0.1
+
+# The number of switch state combinations solved ahead of time while the worker is idle
+PRECOMPUTE_BUDGET = 64
+
+# How long in seconds the shown result may lag behind the latest snapshot before it is out of date
+STALE_DELAY = 0.1
+
+# The number of solved components whose results are kept by the renderer
+COMPONENT_LIMIT = 256
+
+
+# Return the netlists of the circuit with other switch states, starting with those one toggle away, up to the budget.
+# Each switch is a pair of contacts where exactly one is closed
+def switch_variants(netlist, budget):
+    count = len(netlist.switches) // 2
+    variants = []
+    for flips in range(1, count + 1):
+        for flipped in itertools.combinations(range(count), flips):
+            if len(variants) == budget:
+                return variants
+            variant = netlist.canonical()
+            for index in flipped:
+                for contact in (2 * index, 2 * index + 1):
+                    variant.switches[contact] = variant.switches[contact]._replace(
+                        closed=not variant.switches[contact].closed)
+            variants.append(variant)
+    return variants
+
+
+# Solve a netlist with a method of the simulation, returning a result with a warning instead of stopping the worker if
+# the solver raises an error. The ngspice session is unloaded, as the error may have left it part way through a run
+def attempt(simulation, solve, netlist):
+    try:
+        return solve(netlist)
+    except Exception:
+        traceback.print_exc()
+        simulation.session.unload()
+        return SimulationResult({}, evaluate_leds(netlist, {}), ERROR_WARNING)
+
+
+# Solve netlist snapshots sent by the renderer until told to stop, publishing each result with its sequence number,
+# the time taken to solve it and the results of the components it was solved from.
+# While idle, the other switch states of the circuit are solved and published to the table of the renderer. Netlists
+# with clocks are stepped through simulated time in lock-step with the wall clock, publishing a result for every chunk
+# of time
+def run(requests, results, table, budget):
+    simulation = Simulation(ResultCache())
+    sequence, netlist, chunk, epoch = 0, None, 0, 0
+    topology, solved, pending = None, {}, []
+    while True:
+        # Wait for a new snapshot, or only until the next chunk is due if the circuit has clocks
+        timeout = 0 if pending else None
+        if netlist is not None and len(netlist.clocks):
+            timeout = max(0, epoch + simulation.digital.time + TRANSIENT_CHUNK - time.perf_counter())
+        try:
+            request = requests.get(timeout=timeout)
+
+            # If more snapshots arrived while solving, skip straight to the newest one
+            while True:
+                try:
+                    request = requests.get_nowait()
+                except queue.Empty:
+                    break
+
+            if request is None:
+                break
+
+            sequence, netlist = request
+            chunk, pending = 0, []
+            if not len(netlist.clocks):
+                if netlist.topology() != topology:
+                    topology, solved = netlist.topology(), {}
+                fingerprint = netlist.fingerprint()
+                start = time.perf_counter()
+                if fingerprint in solved:
+                    result, components = solved[fingerprint], {}
+                else:
+                    result = attempt(simulation, simulation.solve, netlist)
+                    components = simulation.results
+                results.put(((sequence, chunk), result, time.perf_counter() - start, components))
+                pending = [i for i in switch_variants(netlist, budget) if i.fingerprint() not in solved]
+                continue
+
+            # Simulated time carries on from where it was, so clocks keep their phase when a switch is toggled
+            epoch = time.perf_counter() - simulation.digital.time
+            start = time.perf_counter()
+            result = attempt(simulation, lambda i: simulation.step(i, 0), netlist)
+            results.put(((sequence, chunk), result, time.perf_counter() - start, {}))
+
+            # Simulated time does not move on after an error, so the circuit is not stepped until it changes
+            if result.warning == ERROR_WARNING:
+                netlist = None
+
+        except queue.Empty:
+            # Solve one switch state ahead of time, then check for a new snapshot again
+            if pending:
+                variant = pending.pop(0)
+                fingerprint = variant.fingerprint()
+                solved[fingerprint] = attempt(simulation, simulation.solve, variant)
+                table.put((sequence, fingerprint, solved[fingerprint], simulation.results))
+
+                # Only the switch states solved most recently are kept
+                while len(solved) > 2 * budget:
+                    del solved[next(iter(solved))]
+                continue
+
+        if netlist is None or not len(netlist.clocks):
+            continue
+
+        # If simulating a chunk takes longer than the chunk itself, simulated time slows down instead of falling
+        # further and further behind
+        elapsed = time.perf_counter() - epoch
+        if elapsed - simulation.digital.time > TRANSIENT_MAX_LAG:
+            epoch = time.perf_counter() - simulation.digital.time - TRANSIENT_MAX_LAG
+            elapsed = simulation.digital.time + TRANSIENT_MAX_LAG
+        while simulation.digital.time + TRANSIENT_CHUNK <= elapsed:
+            chunk += 1
+            start = time.perf_counter()
+            result = attempt(simulation, lambda i: simulation.step(i, TRANSIENT_CHUNK), netlist)
+            results.put(((sequence, chunk), result, time.perf_counter() - start, {}))
+            if result.warning == ERROR_WARNING:
+                netlist = None
+                break
+
+
+class SimulationWorker:
+    """The simulation worker solves the circuit in a separate process so that a slow or non-converging solve never
+    stalls rendering. Every netlist snapshot sent to the worker is numbered, and results are read into a double
+    buffer without blocking. Results for a snapshot older than the current netlist are stale and are not applied. A
+    circuit in the result cache is read from disk by the worker rather than solved, so the renderer never hashes a
+    netlist or waits on the disk. An error while solving is shown as a warning rather than stopping the worker, and a
+    worker which dies is started again.
+
+    While idle, the worker solves the circuit with other switch states, starting with those one toggle away, so that
+    pressing a switch is only a lookup in the table of precomputed results. The worker also publishes the result of
+    every component it solves, so a snapshot whose components have all been solved before is combined from them and
+    shown straight away, even when the rest of the circuit has changed.
+
+    When the circuit has clocks, the worker publishes a result for every chunk of simulated time.
+
+    Snapshots are only taken when the scheduler says a simulation tick is due, so the netlist is not rebuilt on every
+    frame, and ticks are spaced out when the solver falls behind."""
+
+    def __init__(self, budget=PRECOMPUTE_BUDGET, rate=SIMULATION_RATE):
+        self.budget = budget
+        self.requests, self.results, self.precomputed, self.process = None, None, None, None
+        self.start()
+        self.scheduler = SimulationScheduler(rate)
+        self.displays = []
+        self.fingerprint = None
+        self.topology = None
+        self.topology_sequence = 0
+        self.table = {}
+        self.components = {}
+        self.sequence = 0
+        self.submitted = 0
+        self.front = ((0, 0), SimulationResult({}, [], ""))
+        self.back = ((0, 0), SimulationResult({}, [], ""))
+        self.timings = {}
+        self.netlist = None
+
+    # Start a worker process with new queues, as those of a worker which died may have been left locked
+    def start(self):
+        context = multiprocessing.get_context("spawn")
+        self.requests = context.Queue()
+        self.results = context.Queue()
+        self.precomputed = context.Queue()
+        self.process = context.Process(target=run, args=(self.requests, self.results, self.precomputed, self.budget),
+                                       daemon=True)
+        self.process.start()
+
+    # Start a new worker if the last one has died. The snapshot it was solving is not sent again, as it may be what
+    # killed the worker, so it is shown as an error until the circuit changes
+    def restart(self):
+        if self.process.is_alive():
+            return
+        self.start()
+        if self.netlist is not None and not self.current():
+            self.back = ((self.sequence, 0), SimulationResult({}, evaluate_leds(self.netlist, {}), ERROR_WARNING))
+
+    # Send a netlist snapshot to the worker to be solved
+    def submit(self, netlist):
+        self.sequence += 1
+        self.submitted = time.perf_counter()
+        self.netlist = netlist
+        self.requests.put((self.sequence, netlist))
+
+        # Nets are only named the same way while the topology stays the same
+        topology = netlist.topology()
+        if topology != self.topology:
+            self.topology = topology
+            self.topology_sequence = self.sequence
+            self.table = {}
+
+    # Read every published result without blocking, and swap buffers if the newest is more recent than the front
+    def poll(self):
+        self.restart()
+        while True:
+            try:
+                key, result, duration, components = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.store(components)
+            self.timings["solve"] = self.timings.get("solve", 0) + duration
+            self.scheduler.record(solve=duration)
+            if key > max(self.front[0], self.back[0]):
+                self.back = (key, result)
+        if self.back[0] > self.front[0]:
+            self.front, self.back = self.back, self.front
+
+        # Switch states solved ahead of time are only kept while the topology they were solved for stays the same
+        while True:
+            try:
+                sequence, fingerprint, result, components = self.precomputed.get_nowait()
+            except queue.Empty:
+                break
+            self.store(components)
+            if sequence >= self.topology_sequence:
+                self.table[fingerprint] = result
+                while len(self.table) > 2 * self.budget:
+                    del self.table[next(iter(self.table))]
+
+    # Keep the results of solved components, which are named by canonical nets and so stay valid when the topology of
+    # the rest of the circuit changes. Only those solved most recently are kept
+    def store(self, components):
+        for fingerprint, result in components.items():
+            self.components.pop(fingerprint, None)
+            self.components[fingerprint] = result
+        while len(self.components) > COMPONENT_LIMIT:
+            del self.components[next(iter(self.components))]
+
+    # Check if the front buffer holds the result of the latest netlist snapshot
+    def current(self):
+        return self.front[0][0] == self.sequence
+
+    # Check if the latest netlist snapshot has been waiting for its result for longer than the stale delay
+    def stale(self):
+        return not self.current() and time.perf_counter() - self.submitted > STALE_DELAY
+
+    # Send the project to the worker if a simulation tick is due and it has changed, and update the LEDs if the latest
+    # result has arrived. The time taken to build the netlist and update the LEDs, and by the worker to solve any
+    # results which arrived, is kept
+    def simulate(self, project):
+        self.timings = {}
+        if self.scheduler.due():
+            start = time.perf_counter()
+            netlist, self.displays = build_netlist(project)
+            netlist = netlist.canonical()
+            fingerprint = netlist.fingerprint()
+            if fingerprint != self.fingerprint:
+                self.fingerprint = fingerprint
+                self.submit(netlist)
+
+                # A switch state solved ahead of time, or a circuit whose components have all been solved before,
+                # is shown straight away
+                if fingerprint in self.table:
+                    self.back = ((self.sequence, 0), self.table[fingerprint])
+                elif not len(netlist.clocks):
+                    combined = combine(netlist, lambda component: self.components.get(component.fingerprint()))
+                    if combined is not None:
+                        self.back = ((self.sequence, 0), combined)
+            self.timings["netlist"] = time.perf_counter() - start
+            self.scheduler.record(netlist=self.timings["netlist"])
+        self.poll()
+        result = self.front[1]
+        start = time.perf_counter()
+        if self.current():
+            apply_result(self.displays, result)
+        self.timings["leds"] = time.perf_counter() - start
+        return result.warning
+
+    # Stop the worker process
+    def close(self):
+        self.requests.put(None)
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
@@ -1,30 +1,33 @@
 import math
+import multiprocessing
 import pickle
+import time
 from pathlib import Path
 
-import PySpice.Spice.NgSpice.Shared
 import pygame
 import os
-import uuid
+import sys
 
 from tkinter import filedialog as fd
 from tkinter import simpledialog as sd
 from tkinter import messagebox as mb
 from pygame.locals import SCALED
-from PySpice.Unit import *
-from PySpice.Spice.Netlist import Circuit
 from PySpice.Logging.Logging import setup_logging
 
 from runtime.environment import Environment
+from runtime.profiler import FrameProfiler, SECTIONS
+from runtime.scheduler import SIMULATION_RATE
 
 from ui.text import TextHandler
 from ui.colours import *
+from ui.damage import Damage
 from ui.visualiser import Visualiser
 from ui.button import Button, ElementManager
 from ui.interface import TabbedMenu
 
 from protosim.project import Project, Occupier
-from logic.electronics import Wire, ICSpiceSubCircuit, Sink, Node
+from logic.electronics import Wire
+from logic.worker import SimulationWorker
 from logic.parts import PartManager, Part, parse, PowerSupply, Breadboard, IntegratedCircuit, LED, PluginPart, Switch
 
 # Versioning
@@ -48,6 +51,12 @@ ENV = Environment()
 HOME_FPS = 60
 PROTOSIM_FPS = 120
 
+# The circuit is simulated at its own rate, which can be lowered on slow machines with this environment variable
+SIMULATION_RATE_VARIABLE = "DEVOLT_SIMULATION_RATE"
+
+# Per-frame timings are appended to the JSONL file named by this environment variable, if it is set
+TELEMETRY_VARIABLE = "DEVOLT_TELEMETRY"
+
 # Enum values for code readability
 HOME, PROTOSIM = 0, 1
 TOP, LEFT, BOTTOM, RIGHT = 0, 1, 2, 3
@@ -92,38 +101,125 @@ def draw_circuit_graphic(win, visualiser):
     visualiser.draw(win)
 
 
-def draw_sim(win, sidebar_width, project, buttons, title, sidebar, show_datasheet):
-    """Draw the simulator space"""
-
-    # Background
-    win.fill(COL_HOME_BKG)
+def draw_sim(win, sidebar_width, project, buttons, title, sidebar, show_datasheet, profiler, damage, events, overlays):
+    """Draw the regions of the simulator space which changed since the previous frame, with the (name, region,
+    content, surface) overlays on top of the project"""
 
     # Set the project size if sidebar is open
     if project.width != WIDTH-sidebar_width:
         project.set_size(width=WIDTH-sidebar_width)
 
-    # Draw action bar text elements
-    action_text, action_shadow = title
-    action_coords = (WIDTH/2 - action_text.get_width()/2, ACTION_BAR_HEIGHT/2 - action_text.get_height()/2)
-    win.blit(action_shadow, tuple(x + 1 for x in action_coords))
-    win.blit(action_text, action_coords)
-
-    # Draw project
+    # Update the project, which keeps the regions of its surface that changed
     project.pos = (sidebar_width, ACTION_BAR_HEIGHT)
-    win.blit(project.surface(), project.pos)
-
-    # Draw action bar buttons
-    buttons.draw(win)
-
-    # Draw datasheet
-    if show_datasheet[0]:
-        win.blit(show_datasheet[1], project.pos)
-        pygame.draw.rect(win, COL_BLACK, show_datasheet[1].get_rect(topleft=project.pos), width=2)
-
-    # Draw sidebar
+    with profiler.measure("project"):
+        surface = project.surface()
+    damage.add(*(rect.move(project.pos) for rect in project.damage))
+
+    # The action bar and sidebar respond to the mouse and keyboard, so they are redrawn whenever there are events.
+    # Overlays are redrawn where they were and where they are whenever they change
+    action_rect = pygame.Rect(0, 0, WIDTH, ACTION_BAR_HEIGHT)
+    sidebar_rect = pygame.Rect(0, ACTION_BAR_HEIGHT, sidebar_width, HEIGHT - ACTION_BAR_HEIGHT)
+    if events:
+        damage.add(action_rect, sidebar_rect)
+    datasheet_rect = show_datasheet[1].get_rect(topleft=project.pos) if show_datasheet[0] else None
+    damage.track("datasheet", datasheet_rect, show_datasheet[1])
+    for name, rect, content, _ in overlays:
+        damage.track(name, rect, content)
+    regions = damage.regions()
+
+    # Update the hover states of the buttons before they are drawn
+    buttons.draw(win, draw=False)
+    sidebar_surface = None
     if sidebar_width > 0:
-        win.blit(sidebar.surface(), (0, ACTION_BAR_HEIGHT))
         sidebar.listen()
+        if sidebar_rect.collidelist(regions) != -1:
+            with profiler.measure("sidebar"):
+                sidebar_surface = sidebar.surface()
+
+    # Everything is drawn clipped to each changed region in turn, as the rest of the window is already up to date
+    action_text, action_shadow = title
+    action_coords = (WIDTH/2 - action_text.get_width()/2, ACTION_BAR_HEIGHT/2 - action_text.get_height()/2)
+    for region in regions:
+        win.set_clip(region)
+        win.fill(COL_HOME_BKG)
+
+        # Draw action bar text elements and buttons
+        if region.colliderect(action_rect):
+            win.blit(action_shadow, tuple(x + 1 for x in action_coords))
+            win.blit(action_text, action_coords)
+            buttons.draw(win)
+
+        # Draw project
+        win.blit(surface, project.pos)
+
+        # Draw datasheet
+        if datasheet_rect is not None and region.colliderect(datasheet_rect):
+            win.blit(show_datasheet[1], project.pos)
+            pygame.draw.rect(win, COL_BLACK, datasheet_rect, width=2)
+
+        # Draw sidebar
+        if sidebar_surface is not None:
+            win.blit(sidebar_surface, (0, ACTION_BAR_HEIGHT))
+
+        # Draw overlays
+        for _, rect, _, overlay in overlays:
+            if rect is not None and region.colliderect(rect):
+                win.blit(overlay, rect)
+    win.set_clip(None)
+
+
+def hud_overlay(sidebar_width, profiler, text_handler):
+    """Render the rolling p50/p99 timings of each part of a frame as an overlay over the project, returning its
+    region, content and surface"""
+    rows = [("section", "p50 ms", "p99 ms")]
+    for section in SECTIONS:
+        p50, p99 = profiler.percentile(section, 50), profiler.percentile(section, 99)
+        rows.append((section, "-", "-") if p50 is None else (section, f"{p50:.2f}", f"{p99:.2f}"))
+    rows = [[text_handler.render(i) for i in row] for row in rows]
+
+    # Each column is as wide as its widest text
+    widths = [max(row[i].get_width() for row in rows) + 20 for i in range(3)]
+    height = rows[0][0].get_height()
+    hud_rect = pygame.Rect(sidebar_width + 10, ACTION_BAR_HEIGHT + 10, sum(widths), height * len(rows) + 20)
+    hud = pygame.Surface(hud_rect.size, pygame.SRCALPHA)
+    hud.fill((0, 0, 0, 200))
+    for index, row in enumerate(rows):
+        x = 10
+        for width, label in zip(widths, row):
+            hud.blit(label, (x, 10 + index * height))
+            x += width
+    return hud_rect, profiler.count, hud
+
+
+def status_overlay(simulation, text_handler):
+    """Render a status indicator for the corner of the project if the shown results are out of date or throttled,
+    returning its region, text and surface"""
+    if simulation.stale():
+        status = "Simulating..."
+    elif simulation.scheduler.throttled():
+        status = f"Simulating at {simulation.scheduler.rate():.0f} Hz"
+    else:
+        return None, None, None
+    label = text_handler.render(status, colour=COL_BLACK)
+    status_rect = label.get_rect(bottomright=(WIDTH - 10, HEIGHT - 10)).inflate(20, 10)
+    overlay = pygame.Surface(status_rect.size)
+    overlay.fill(COL_WARNING)
+    overlay.blit(label, label.get_rect(center=overlay.get_rect().center))
+    return status_rect, status, overlay
+
+
+def warning_overlay(warning, text_handler):
+    """Render a pending warning for the corner of the project, returning its region, text and surface"""
+    if warning == "":
+        return None, None, None
+    warning_label, height = text_handler.render_multiline(warning, width=280, colour=COL_BLACK)
+    overlay = pygame.Surface((300, height + 40))
+    overlay.fill(COL_WARNING)
+    acc = 0
+    for label in warning_label:
+        overlay.blit(label, (20, 20 + acc))
+        acc += label.get_height() + 5
+    return overlay.get_rect(topleft=(WIDTH - 300, ACTION_BAR_HEIGHT)), warning, overlay
 
 
 def open_dev():
@@ -140,30 +236,6 @@ def save_dev(project):
     return file
 
 
-def unionise_nodes(nodes):
-    """Takes a list of lists and returns a list with all common elements amongst original lists paired"""
-    out = []
-    while len(nodes) > 0:
-        first, *rest = nodes
-        first = set(first)
-
-        lf = -1
-        while len(first) > lf:
-            lf = len(first)
-
-            rest2 = []
-            for r in rest:
-                if len(first.intersection(set(r))) > 0:
-                    first |= set(r)
-                else:
-                    rest2.append(r)
-            rest = rest2
-
-        out.append(first)
-        nodes = rest
-    return out
-
-
 def main():
 
     # Initialise pygame modules
@@ -247,6 +319,16 @@ def main():
     # Store if the datasheet should be shown
     show_datasheet = (False, None)
 
+    # Circuit simulation of the project, solved in a worker process at its own rate
+    simulation = SimulationWorker(rate=float(os.environ.get(SIMULATION_RATE_VARIABLE, SIMULATION_RATE)))
+
+    # Timings of each frame, shown in the performance HUD and optionally written out as telemetry
+    profiler = FrameProfiler(os.environ.get(TELEMETRY_VARIABLE))
+    show_hud = False
+
+    # Regions of the window which changed during a frame, the only ones presented to the display
+    damage = Damage((WIDTH, HEIGHT))
+
     while running:
 
         # Check for invalid SPICE netlists, dead LEDs, post warning if so
@@ -254,142 +336,11 @@ def main():
 
         # Limit the loop to run at the frame tick rate
         clock.tick(fps)
+        frame_start = time.perf_counter()
 
-        # Create a virtual SPICE circuit
-        circuit = Circuit("dev", ground="gnd")
-
-        # IS = Saturated Current, RS = Ohmic Parasitic Resistance, N = Emission Coefficient
-        circuit.model('LED', 'D', IS=1e-19, N=1.6, RS=2.5, EG=2.1)
-
-        # Find all power supplies and breadboards in the project
-        supplies = [supply for supply in project.boards.values() if isinstance(supply, PowerSupply)]
-        boards = [board for board in project.boards.values() if isinstance(board, Breadboard)]
-
-        # Reset all nodes
-        for node in Node.instances:
-            node.temp = node.uuid
-
-        # Unionise wire sets to create common nodes in virtual circuit
-        connected = []
-        for wire in project.wires:
-            a = wire.point_a.common
-            b = wire.point_b.common
-            if wire.resistance != 0:
-                continue
-            connected.append([a, b])
-
-        # Connect switch nodes together
-        for board in boards:
-            for plugin in board.plugins:
-                plugin_object = board.plugins[plugin]
-                if isinstance(plugin_object, Switch):
-                    pins_to_nodes = plugin_object.pins_to_nodes
-                    connected.append([pins_to_nodes[0], pins_to_nodes[5]])
-                    connected.append([pins_to_nodes[1], pins_to_nodes[4]])
-                    connected.append([pins_to_nodes[2], pins_to_nodes[3]])
-                    if plugin_object.state:
-                        connected.append([pins_to_nodes[1], pins_to_nodes[2]])
-                    else:
-                        connected.append([pins_to_nodes[1], pins_to_nodes[0]])
-
-        connected = unionise_nodes(connected)
-
-        # Give all unionised nodes a new unique identifier
-        for common_node in connected:
-            new_uuid = str(uuid.uuid4()) if not len([i for i in common_node if isinstance(i, Sink)]) else "gnd"
-            for child_node in common_node:
-                child_node.temp = new_uuid
-
-        displays = []
-        goes_to_gnd = []
-
-        # Create voltage sources in virtual circuit
-        for index, supply in enumerate(supplies):
-            circuit.V(index, supply.points[0].common.temp, supply.points[1].common.temp, supply.voltage)
-
-        # Create ICs and Electronics in virtual circuit
-        for index, board in enumerate(boards):
-            for jndex, plugin in enumerate(board.plugins):
-                plugin_object = board.plugins[plugin]
-                if isinstance(plugin_object, IntegratedCircuit) and not isinstance(plugin_object, Switch):
-                    name, raw, nodes = plugin_object.name, plugin_object.raw_spice, plugin_object.spice_nodes
-                    pins_to_nodes = [i.temp for i in plugin_object.pins_to_nodes.values()]
-                    circuit.subcircuit(ICSpiceSubCircuit(f'{plugin_object.name}-{index}{jndex}', raw, nodes))
-                    circuit.X(f'{index}{jndex}', f'{plugin_object.name}-{index}{jndex}', *pins_to_nodes)
-                if isinstance(plugin_object, LED):
-                    if not plugin_object.cathode_connecting:
-                        point_a, point_b = plugin_object.anode_point.common.temp, plugin_object.cathode_point.common.temp
-                        circuit.Diode(f'{index}{jndex}', point_a, point_b, model='LED')
-                        displays.append(plugin_object)
-
-        # Create resistors in virtual circuit
-        for index, wire in enumerate(project.wires):
-            if wire.resistance != 0:
-                circuit.R(index, wire.point_a.common.temp, wire.point_b.common.temp, int(wire.resistance))
-                if wire.point_a.common.temp == "gnd":
-                    goes_to_gnd.append(wire.point_b.common.temp)
-                if wire.point_b.common.temp == "gnd":
-                    goes_to_gnd.append(wire.point_a.common.temp)
-
-        # Simulate the circuit
-        simulator = circuit.simulator()
-
-        # If there are elements present in the circuit, evaluate their logic state
-        try:
-            if len(circuit.elements):
-                analysis = simulator.operating_point()
-                node_analysis = analysis.nodes
-            else:
-                node_analysis = {}
-        except PySpice.Spice.NgSpice.Shared.NgSpiceCommandError:
-            warning += "Oops! Looks like one of your electrical components has floating input/s " \
-                       "(not connected). Check to make sure ALL inputs are plugged in, even if they are" \
-                       " not in use! You may have also shorted your power supply."
-            node_analysis = {}
-
-        # For every LED in the project, evaluate if it is receiving the correct power
-        # If so, turn it on or kill it
-        for display in displays:
-            if display.alive:
-                point_a, point_b = display.anode_point.common.temp, display.cathode_point.common.temp
-                if point_a in node_analysis:
-                    if 2 >= float(node_analysis[point_a]) >= 1.2 and point_b == circuit.gnd:
-                        display.state = 1
-                    else:
-                        if float(node_analysis[point_a]) > 2:
-                            if point_b == circuit.gnd:
-                                display.alive = False
-                                display.state = 0
-                            elif point_b in node_analysis:
-                                if 2 >= (float(node_analysis[point_a]) - float(node_analysis[point_b])) >= 1.2:
-                                    display.state = 1
-                                else:
-                                    if (float(node_analysis[point_a]) - float(node_analysis[point_b])) > 2:
-                                        display.alive = False
-                                    display.state = 0
-                            else:
-                                display.state = 0
-                        elif float(node_analysis[point_a]) < 1.2:
-                            display.state = 0
-                        else:
-                            if point_b in goes_to_gnd:
-                                display.state = 1
-                            else:
-                                display.state = 0
-                else:
-                    display.state = 0
-            else:
-                warning += "An LED has received too much voltage/current and has died " \
-                           "(indicated by an X on the LED). Please replace it and use a resistor to limit the current."
-
-        # Obliterate stupid memory leak
-        if len(circuit.elements):
-            try:
-                ngspice = simulator.factory(circuit).ngspice
-                ngspice.remove_circuit()
-                ngspice.destroy()
-            except PySpice.Spice.NgSpice.Shared.NgSpiceCommandError:
-                pass
+        # Simulate the project and update the state of its LEDs
+        warning += simulation.simulate(project)
+        profiler.update(simulation.timings)
 
         # Check if the project was saved
         saved = "" if project.saved[0] else "*"
@@ -397,10 +348,13 @@ def main():
         mouse_button_down = False
 
         # Check for new events 
-        for event in pygame.event.get():
+        events = pygame.event.get()
+        for event in events:
 
             # Exit the program if the user quit
             if event.type == pygame.QUIT:
+                simulation.close()
+                profiler.close()
                 pygame.quit()
                 sys.exit()
 
@@ -423,6 +377,8 @@ def main():
                         edit_button.pos = (WIDTH / 2 + action_bar_title[0].get_width() / 2 + 10 + 5, edit_button.pos[1])
 
                 if event.type == EXIT_EVENT:
+                    simulation.close()
+                    profiler.close()
                     pygame.quit()
                     sys.exit()
 
@@ -431,6 +387,7 @@ def main():
 
                 # Change made in the project
                 if event.type == PROJECT_CHANGE_EVENT:
+                    simulation.scheduler.wake()
                     action_bar_title = action_text_handler.render_shadow(saved + project.display_name)
                     edit_button.pos = (WIDTH / 2 + action_bar_title[0].get_width() / 2 + 10 + 5, edit_button.pos[1])
 
@@ -636,6 +593,10 @@ def main():
 
                         ENV.query_disable.clear()
 
+                    # Show or hide the performance HUD
+                    if event.key == pygame.K_F3:
+                        show_hud = not show_hud
+
                     # Show a datasheet if an Integrated Circuit was selected
                     if event.key == pygame.K_d:
 
@@ -666,11 +627,17 @@ def main():
                             ENV.selected = None
                             ENV.query_disable.clear()
 
+        # Changing the page or the layout, or the window being uncovered, redraws everything
+        damage.track("layout", damage.window, (current_state, sidebar_width))
+        if any(event.type == pygame.WINDOWEXPOSED for event in events):
+            damage.add_all()
+
         # Display the page corresponding to the program state
         if current_state == HOME:
 
             pygame.display.set_caption(f"Home • de:volt")
             draw_homepage(win, home_title, home_version, visualiser, home_button_manager)
+            damage.add_all()
 
             # Change the cursor back to an arrow
             if not home_button_manager.hovered:
@@ -680,18 +647,16 @@ def main():
         if current_state == PROTOSIM:
 
             pygame.display.set_caption(f"{saved}{project.display_name} • de:volt")
-            draw_sim(win, sidebar_width, project, sim_manager, action_bar_title, sidebar, show_datasheet)
-
-            # If there is a pending warning, show it
-            if warning != "":
-                warning_rect = pygame.Rect(WIDTH - 300, ACTION_BAR_HEIGHT, 300, 0)
-                warning_label, height = version_handler.render_multiline(warning, width=warning_rect.w - 20, colour=COL_BLACK)
-                warning_rect.h = height + 40
-                pygame.draw.rect(win, COL_WARNING, warning_rect)
-                acc = 0
-                for label in warning_label:
-                    win.blit(label, (WIDTH - 300 + 20, ACTION_BAR_HEIGHT + 20 + acc))
-                    acc += label.get_height() + 5
+
+            # Show any pending warning, whether the results of the simulation are behind the project, and the timings
+            # of recent frames if the performance HUD is enabled, which change every frame. Only the regions which
+            # changed are drawn and presented
+            overlays = [("warning", *warning_overlay(warning, version_handler)),
+                        ("status", *status_overlay(simulation, version_handler)),
+                        ("hud", *(hud_overlay(sidebar_width, profiler, version_handler) if show_hud else
+                                  (None, None, None)))]
+            draw_sim(win, sidebar_width, project, sim_manager, action_bar_title, sidebar, show_datasheet, profiler,
+                     damage, events, overlays)
 
             # Change the cursor back to an arrow
             if not sim_manager.hovered:
@@ -704,9 +669,14 @@ def main():
                     if ENV.selected is not None:
                         if isinstance(ENV.selected, Switch):
                             ENV.selected.state = 1 - ENV.selected.state
+                            simulation.scheduler.wake()
 
-        pygame.display.update()
+        with profiler.measure("flip"):
+            damage.present()
+        profiler.add("frame", time.perf_counter() - frame_start)
+        profiler.end_frame()
 
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
     main()
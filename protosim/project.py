@@ -5,7 +5,9 @@ import pygame
 from operator import sub, mul
 from pathlib import Path
 
+from logic.nets import NetTable
 from logic.vectormath import Vector
+from protosim.textures import TextureCache
 from ui.colours import *
 from ui.text import TextHandler
 from tkinter import Tk, StringVar, OptionMenu, Button
@@ -13,16 +15,25 @@ from tkinter import Tk, StringVar, OptionMenu, Button
 
 class SaveState:
     """The savestate is a pickleable structure used to document the state of a project, whether it is to be
-    used as an undo or redo state, or if it is to be serialised into a save file"""
+    used as an undo or redo state, or if it is to be serialised into a save file. A loaded savestate can be simulated
+    on its own, so it owns a net table which is left out of the serialised state"""
 
     def __init__(self, boards, wires, name):
         self.boards = boards
         self.wires = wires
         self.name = name
+        self.nets = NetTable()
 
     def get_attrs(self):
         return self.boards, self.wires, self.name
 
+    def __getstate__(self):
+        return {"boards": self.boards, "wires": self.wires, "name": self.name}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.nets = NetTable()
+
 
 class Project:
     """The Project structure holds all information about any element children, and the details of the project. It
@@ -54,7 +65,15 @@ class Project:
         self.colour_text = self.wire_colour_handler.render("Select wire colour", colour=COL_BLACK)
         self.resist_text = self.wire_colour_handler.render("Change resistance", colour=COL_BLACK)
         self.saved = (True, None)
-        self.cached = {}
+        self.cached = TextureCache()
+        self.damage = []
+        self.scene = None
+        self.inputs = None
+        self.hover = set()
+        self.positions = {}
+        self.wire_rects = {}
+        self.buttons = []
+        self.nets = NetTable()
 
     # Change the offset used to pan the editing area
     def shift(self, x, y):
@@ -91,8 +110,10 @@ class Project:
         self.in_hand = None
         self.point_hovered = None
         self.incomplete_wire = None
+        self.nets = NetTable()
         self.saved = (True, None)
         self.cached.clear()
+        self.scene = None
         self.env.reset()
 
     # An event called when any change is made to the project
@@ -105,35 +126,8 @@ class Project:
     # For every wire in the project, update the references such that when loaded from a save state,
     # the wire correctly simulates a connection between regenerated nodes
     def rejuvenate(self):
-        from logic.parts import PowerSupply, Breadboard
-        for wire in self.wires:
-            old_point_a_group = wire.point_a.discriminator.name
-            group_1 = None
-            if isinstance(wire.point_a.parent, PowerSupply):
-                if wire.point_a.discriminator.row:
-                    wire.point_a = wire.point_a.parent.points[0]
-                else:
-                    wire.point_a = wire.point_a.parent.points[1]
-            elif isinstance(wire.point_a.parent, Breadboard):
-                if old_point_a_group == "main":
-                    group_1 = wire.point_a.parent.main_board_rects
-                elif old_point_a_group == "power":
-                    group_1 = wire.point_a.parent.pr_rects
-                wire.point_a = group_1[wire.point_a.discriminator][2]
-
-            old_point_b_group = wire.point_b.discriminator.name
-            group_2 = None
-            if isinstance(wire.point_b.parent, PowerSupply):
-                if wire.point_b.discriminator.row:
-                    wire.point_b = wire.point_b.parent.points[0]
-                else:
-                    wire.point_b = wire.point_b.parent.points[1]
-            elif isinstance(wire.point_b.parent, Breadboard):
-                if old_point_b_group == "main":
-                    group_2 = wire.point_b.parent.main_board_rects
-                elif old_point_b_group == "power":
-                    group_2 = wire.point_b.parent.pr_rects
-                wire.point_b = group_2[wire.point_b.discriminator][2]
+        from logic.parts import rejuvenate_wires
+        rejuvenate_wires(self.wires)
 
     # Change the scale factor which depicts the zoom of the project editing space
     # Alter the offset based on the mouse position to create accurate zooming
@@ -150,7 +144,6 @@ class Project:
         point_after_zoom = (mouse[0]/self.zoom, mouse[1]/self.zoom)
         delta = tuple(map(lambda i, j: math.floor((i - j)*self.zoom), point_after_zoom, point_before_zoom))
         self.shift(*delta)
-        self.cached.clear()
 
     # Set the size of the project if it was increased or decreased when a sidebar was opened
     def set_size(self, width=None, height=None):
@@ -289,29 +282,150 @@ class Project:
         # Only draw the LEDs if necessary
         if led_only:
             element_surf, rect_hovered = element.surface_led(), None
+            layer, drawn = "leds", element.drawn_leds
         else:
             element_surf, rect_hovered = element.surface(real_element_pos, scale)
+            layer, drawn = "board", element.drawn
 
-        # Scale and draw the surface if necessary
+        # Scale and draw the surface if necessary. Scaled surfaces are cached, so they are only tinted on a copy
         if draw:
-            surf = pygame.transform.scale(element_surf, size)
-            surf.fill(colour, None, pygame.BLEND_RGBA_MULT)
+            surf = self.cached.scale(element, layer, drawn, element_surf, size)
+            if colour != (255, 255, 255, 255):
+                surf = surf.copy()
+                surf.fill(colour, None, pygame.BLEND_RGBA_MULT)
             win.blit(surf, self.coord_to_point(coord))
 
         return scale, coord, rect_hovered, self.coord_to_point(coord)
 
+    # Return everything drawn in the editing space apart from what is under the mouse, so that the surface only needs
+    # to be redrawn when it or the mouse changes
+    def scene_state(self):
+        plugins = tuple((point, plugin, getattr(plugin, "state", None), getattr(plugin, "alive", None),
+                         getattr(plugin, "cathode_connecting", None), getattr(plugin, "anode_point", None),
+                         getattr(plugin, "cathode_point", None))
+                        for board in self.boards.values() for point, plugin in getattr(board, "plugins", {}).items())
+        wires = tuple((wire, wire.point_a, wire.point_b, wire.colour, wire.resistance) for wire in self.wires)
+        # Plugins, wires and buttons which are only disabled from being queried because they are hovered are part of
+        # the hover state instead
+        disabled = tuple(i for i in self.env.query_disable if not isinstance(i, pygame.Rect) and i not in self.wires)
+        return (self.origin, self.zoom, self.width, self.height, tuple(self.boards.items()), plugins, wires,
+                self.in_hand, self.incomplete_wire, self.env.selected, disabled)
+
+    # Return the state of the mouse and the keys which change what is drawn when hovering
+    def input_state(self):
+        keys_pressed = pygame.key.get_pressed()
+        return (pygame.mouse.get_pos(), pygame.mouse.get_pressed(), keys_pressed[pygame.K_LCTRL],
+                keys_pressed[pygame.K_LSHIFT])
+
+    # Return the regions of the editing space which are drawn differently while the mouse is over them, which are the
+    # outline and hovered point of the boards under the mouse, the hovered plugin and the wire hovered while shift is
+    # held. What is hovered depends on what is disabled from being queried, as whichever of a plugin, a wire or a
+    # button of the wire editing box was hovered first stops the others from being hovered. The rules of drawing are
+    # followed on a copy of what is disabled, from where everything was last drawn, so the regions are known before
+    # anything is drawn again. Like drawing, they are found twice if what is disabled changes the first time
+    def hover_state(self, positions):
+        mouse = tuple(map(sub, pygame.mouse.get_pos(), self.pos))
+        shift = pygame.key.get_pressed()[pygame.K_LSHIFT]
+        disabled = list(self.env.query_disable)
+        for _ in range(2):
+            previous, hover = list(disabled), set()
+            for element, (scale, _, real_pos) in positions.items():
+                for plugin, plugin_obj in getattr(element, "plugins", {}).items():
+                    if disabled and disabled != [plugin.rect]:
+                        continue
+                    plugin_surf = plugin_obj.surface(element)[0]
+                    plugin_pos = element.plugin_position(plugin, plugin_surf)
+                    topleft = tuple(map(lambda i, j, k: (i * j) + k, plugin_pos, scale, real_pos))
+                    size = (plugin_surf.get_width() * scale[0], plugin_surf.get_height() * scale[1])
+                    rect = pygame.Rect(topleft, size)
+                    if rect.collidepoint(mouse):
+                        disabled[:] = [plugin.rect]
+                        hover.add(tuple(rect.inflate(4, 4)))
+                    elif plugin.rect in disabled:
+                        disabled.remove(plugin.rect)
+
+                # The outline and hovered point are found the same way the board finds them while drawing
+                rect = pygame.Rect(real_pos, (element.size[0] * self.zoom, element.size[1] * self.zoom))
+                if not disabled and rect.collidepoint(mouse):
+                    hover.add(tuple(rect))
+                    point = element.point_at(tuple(map(sum, zip(self.pos, real_pos))), scale)
+                    if point is not None:
+                        rect = point[0]
+                        topleft = (real_pos[0] + rect.x * scale[0], real_pos[1] + rect.y * scale[1])
+                        hover.add(tuple(pygame.Rect(topleft, (rect.w * scale[0], rect.h * scale[1])).inflate(4, 4)))
+
+            for wire in self.wires:
+                rect = self.wire_rects.get(wire)
+                if rect is not None and rect.collidepoint(mouse) and shift:
+                    if not disabled or wire in disabled:
+                        if wire not in disabled:
+                            disabled.append(wire)
+                        hover.add(tuple(rect))
+                elif wire in disabled:
+                    disabled.remove(wire)
+                if self.env.selected == wire:
+                    for button in self.buttons:
+                        if button.collidepoint(mouse):
+                            if button not in disabled:
+                                disabled.append(button)
+                        elif button in disabled:
+                            disabled.remove(button)
+            if disabled == previous:
+                break
+        return hover
+
     # Returns the full surface of the project, including the editing space and any children elements
+    # The regions of the surface which changed since the previous frame are kept as its damage
     def surface(self):
 
-        # Prepare the surface
-        self.win.fill(COL_SIM_BKG)
-
         # Check for events
         self.listen()
 
         # Process panning changes
         self.origin = (10 + self.offset_x, 10 + self.offset_y)
 
+        # If neither the project nor the mouse has changed, the previous surface is still correct
+        scene, inputs = self.scene_state(), self.input_state()
+        if self.last_surface is not None and scene == self.scene and inputs == self.inputs:
+            self.damage = []
+            return self.win
+
+        # If only the mouse moved, with no button held and no key changed, only the regions it left and entered have
+        # changed. Anything else, including a part or wire following the mouse, or anything changed while drawing,
+        # redraws the whole surface
+        following = self.in_hand is not None or self.incomplete_wire is not None
+        moved = self.last_surface is not None and scene == self.scene and not following and \
+            inputs[1:] == self.inputs[1:] and not any(inputs[1])
+        if moved:
+            self.damage = [pygame.Rect(i) for i in self.hover_state(self.positions) ^ self.hover]
+            self.draw_damage()
+        if not moved or self.scene_state() != scene:
+            self.damage = [self.win.get_rect()]
+            self.draw_damage()
+        self.scene, self.inputs, self.hover = scene, inputs, self.hover_state(self.positions)
+
+        return self.win
+
+    # Draw the damaged regions of the surface, with every drawing clipped to each region in turn. Hovering over a wire
+    # only stops the boards drawn before it from being outlined on the next drawing, so the regions are drawn twice if
+    # what is disabled from being queried changed while drawing them
+    def draw_damage(self):
+        for _ in range(2):
+            disabled = list(self.env.query_disable)
+            for region in self.damage:
+                self.win.set_clip(region)
+                self.positions = self.draw_scene()
+            self.win.set_clip(None)
+            if self.env.query_disable == disabled:
+                break
+
+    # Draw the editing space and any children elements onto the surface of the project, and return where each board
+    # was drawn
+    def draw_scene(self):
+
+        # Prepare the surface
+        self.win.fill(COL_SIM_BKG)
+
         # Draw gridlines
         self.gridlines(self.win, 0)
         self.gridlines(self.win, 1)
@@ -457,6 +571,8 @@ class Project:
         colours = [COL_WIRE_RED, COL_WIRE_BLACK, COL_WIRE_YELLOW, COL_WIRE_WHITE, COL_WIRE_GREEN, COL_WIRE_BLUE]
 
         # Draw all wires
+        if self.win.get_clip() == self.win.get_rect():
+            self.wire_rects = {}
         for wire in self.wires:
 
             # Get the positions of the wire relative to the project surface
@@ -471,8 +587,12 @@ class Project:
             b_scaled_center = tuple(map(mul, b_scale, b_rect.center))
             b_real_center = tuple(map(sum, zip(b_pos, b_scaled_center)))
 
-            # Draw the wire
+            # Draw the wire. Drawing clipped to a damaged region also clips the rect drawn, so the rect of the last full
+            # drawing is kept for finding whether the wire is hovered and where to put its editing box
             wire_rect = pygame.draw.line(self.win, COL_BLACK, a_real_center, b_real_center, width=4)
+            if self.win.get_clip() == self.win.get_rect():
+                self.wire_rects[wire] = wire_rect
+            wire_rect = self.wire_rects[wire]
             pygame.draw.line(self.win, wire.colour, a_real_center, b_real_center, width=2)
 
             # If the wire is a resistor, calculate the perpendicular angled lines
@@ -641,6 +761,9 @@ class Project:
                     pygame.draw.line(self.win, COL_IC_PIN, anode_point, cathode_point, width=4)
             self.draw_scaled_big(self.win, element, coord, True, led_only=True)
 
+        # Keep the buttons of the wire editing box, which are disabled from being queried while they are hovered
+        self.buttons = colour_selection[1:-1]
+
         # Draw previously cached colour rects
         if len(colour_selection):
             for index, rect in enumerate(colour_selection):
@@ -658,7 +781,8 @@ class Project:
                 # If the current item is the resistance button
                 if index == len(colour_selection) - 2:
                     pygame.draw.rect(self.win, COL_HOME_TITLE, rect)
-                    pos = self.win.blit(self.resist_text, (rect.x + 10, rect.y + 5))
+                    pos = self.resist_text.get_rect(topleft=(rect.x + 10, rect.y + 5))
+                    self.win.blit(self.resist_text, pos)
                     current = f"Current: {colour_selection[-1].convert()} ohms"
                     current = self.wire_colour_handler.render(current, colour=COL_BLACK)
                     self.win.blit(current, (pos.right + 20, pos.y))
@@ -670,7 +794,7 @@ class Project:
                     pygame.draw.line(self.win, COL_HOME_SHADOW, rect.topleft, rect.bottomright, width=4)
                     pygame.draw.line(self.win, COL_HOME_SHADOW, rect.topright, rect.bottomleft, width=4)
 
-        return self.win
+        return temp_positions
 
 
 class Occupier:
@@ -0,0 +1,102 @@
+import collections
+import weakref
+
+import pygame
+
+# The most memory the scaled surfaces of parts may take up before the least recently used are removed
+TEXTURE_CACHE_LIMIT = 128 * 1024 * 1024
+
+
+# Return the number of bytes taken up by the pixels of some surfaces
+def size_of(surfaces):
+    return sum(i.get_width() * i.get_height() * i.get_bytesize() for i in surfaces)
+
+
+class TextureCache:
+    """The texture cache keeps the surfaces of parts scaled to each zoom level of the project, so that panning or
+    redrawing a part which has not changed does not scale its texture again. Each scaled surface is stored with the
+    state that was drawn on the part, and is only reused while the part still shows that state.
+
+    When a part is shown at a new zoom level, it is scaled from the nearest level above the new size of a mipmap
+    pyramid, whose levels each halve the one before, rather than from its full texture. The least recently used
+    surfaces are removed when they take up more memory than the limit, and those of a part are removed when the part
+    is deleted. Each part seen is kept with the finaliser which removes its surfaces."""
+
+    def __init__(self, limit=TEXTURE_CACHE_LIMIT):
+        self.limit = limit
+        self.entries = collections.OrderedDict()
+        self.sizes = {}
+        self.parts = {}
+        self.total = 0
+
+    # Store surfaces under a key, removing the least recently used surfaces while the cache is over its limit
+    def store(self, key, state, surfaces):
+        self.discard(key)
+        self.entries[key] = (state, surfaces)
+        self.total += size_of(surfaces)
+        while self.total > self.limit and len(self.entries) > 1:
+            self.discard(next(iter(self.entries)))
+
+    # Remove the surfaces stored under a key
+    def discard(self, key):
+        if key in self.entries:
+            self.total -= size_of(self.entries.pop(key)[1])
+
+    # Return the surfaces stored under a key if they were drawn with the given state, or None
+    def lookup(self, key, state):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != state:
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    # Remove every surface of a part which has been deleted, given the identity it had
+    def forget(self, part):
+        for key in [i for i in self.entries if i[0] == part]:
+            self.discard(key)
+        self.sizes = {key: size for key, size in self.sizes.items() if key[0] != part}
+        self.parts.pop(part, None)
+
+    # Return the mipmap pyramid of a surface, from half its size down to a few pixels
+    def pyramid(self, key, state, surface):
+        levels = self.lookup(key, state)
+        if levels is None:
+            levels = []
+            while min(surface.get_size()) >= 4:
+                surface = pygame.transform.smoothscale(surface, (surface.get_width() // 2, surface.get_height() // 2))
+                levels.append(surface)
+            self.store(key, state, levels)
+        return levels
+
+    # Return a layer of a part drawn with the given state, scaled to the given size. A part which is being zoomed is
+    # scaled from its mipmap pyramid, but a part which has changed at the same zoom is scaled from the surface it was
+    # drawn on, as its pyramid would have to be rebuilt
+    def scale(self, part, layer, state, surface, size):
+        if id(part) not in self.parts:
+            self.parts[id(part)] = weakref.finalize(part, self.forget, id(part))
+        key = (id(part), layer, size)
+        scaled = self.lookup(key, state)
+        if scaled is not None:
+            return scaled[0]
+
+        # Colour keyed surfaces are not filtered, as their transparent colour would bleed into their edges
+        source = surface
+        if self.sizes.get((id(part), layer), size) != size and surface.get_colorkey() is None:
+            for level in self.pyramid((id(part), layer, None), state, surface):
+                if level.get_width() < size[0] or level.get_height() < size[1]:
+                    break
+                source = level
+        self.sizes[(id(part), layer)] = size
+
+        scaled = pygame.transform.scale(source, size)
+        self.store(key, state, [scaled])
+        return scaled
+
+    # Remove every surface, and stop waiting for the parts which were seen to be deleted
+    def clear(self):
+        for finaliser in self.parts.values():
+            finaliser.detach()
+        self.entries.clear()
+        self.sizes.clear()
+        self.parts.clear()
+        self.total = 0
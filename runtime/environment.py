@@ -1,13 +1,16 @@
+import os
 import sys
 
 
 class Environment:
     """The environment serves as a global structure in which any item in the application can interact with other
     items which are in the same environment. It also tracks whether the app is run in a development environment or
-    executable, and stores the program state."""
+    executable, and stores the program state. A headless environment has no display, so parts are created without
+    their textures."""
     
-    def __init__(self):
+    def __init__(self, headless=False):
         self.unfrozen = getattr(sys, 'frozen', False)
+        self.headless = headless
         self.query_disable = []
         self.selected = None
         self.undo_states = []
@@ -25,4 +28,14 @@ class Environment:
     # Get the execution path at runtime
     def get_main_path(self):
         return sys._MEIPASS if self.unfrozen else ''
-    
\ No newline at end of file
+
+
+# Get the directory where de:volt keeps its data for the current user
+def get_data_path():
+    if sys.platform == "win32":
+        base = os.environ.get("APPDATA", os.path.expanduser("~"))
+    elif sys.platform == "darwin":
+        base = os.path.expanduser(os.path.join("~", "Library", "Application Support"))
+    else:
+        base = os.environ.get("XDG_DATA_HOME", os.path.expanduser(os.path.join("~", ".local", "share")))
+    return os.path.join(base, "devolt")
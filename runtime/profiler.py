@@ -0,0 +1,66 @@
+import collections
+import contextlib
+import json
+import time
+
+# The parts of a frame which are timed, in the order they are shown
+SECTIONS = ("netlist", "solve", "leds", "project", "sidebar", "flip", "frame")
+
+# The number of frames over which the percentiles of each section are taken
+PROFILE_WINDOW = 240
+
+
+class FrameProfiler:
+    """The frame profiler times the parts of every frame, keeping the most recent timings of each part to show their
+    rolling percentiles. If given a path, the timings of every frame are also appended to it as a line of JSON, so
+    that a slow project can be analysed offline."""
+
+    def __init__(self, path=None, window=PROFILE_WINDOW):
+        self.samples = {section: collections.deque(maxlen=window) for section in SECTIONS}
+        self.frame = {}
+        self.count = 0
+        self.start = time.perf_counter()
+        self.file = open(path, "a", buffering=1, encoding="utf-8") if path else None
+
+    # Time the code run inside the context as a section of the current frame
+    @contextlib.contextmanager
+    def measure(self, section):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(section, time.perf_counter() - start)
+
+    # Add a duration in seconds to a section of the current frame
+    def add(self, section, duration):
+        self.frame[section] = self.frame.get(section, 0) + duration
+
+    # Add the durations of several sections to the current frame
+    def update(self, durations):
+        for section, duration in durations.items():
+            self.add(section, duration)
+
+    # Finish the current frame, keeping its timings and writing them out if telemetry is enabled. Sections which did
+    # not run during the frame, such as a solve when the circuit has not changed, are left out
+    def end_frame(self):
+        for section, duration in self.frame.items():
+            self.samples[section].append(duration)
+        if self.file is not None:
+            sample = {"index": self.count, "time": round(time.perf_counter() - self.start, 6)}
+            sample.update((section, round(duration * 1000, 4)) for section, duration in self.frame.items())
+            self.file.write(json.dumps(sample) + "\n")
+        self.count += 1
+        self.frame = {}
+
+    # Return the given percentile of the recent timings of a section in milliseconds, or None if it has not run
+    def percentile(self, section, percent):
+        samples = sorted(self.samples[section])
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * percent / 100))] * 1000
+
+    # Stop writing telemetry
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
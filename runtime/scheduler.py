@@ -0,0 +1,57 @@
+import time
+
+# The number of times per second the circuit is simulated while the solver keeps up
+SIMULATION_RATE = 60
+
+# The longest time between simulation ticks while the solver is behind, so that changes are still shown
+THROTTLE_LIMIT = 0.5
+
+# The share of each frame that building netlists may take up before simulation ticks are spaced out
+NETLIST_SHARE = 0.25
+
+# The weight of the newest duration in the running averages of the scheduler
+SMOOTHING = 0.2
+
+
+class SimulationScheduler:
+    """The simulation scheduler decides when the circuit is next simulated, so that the simulation runs at its own
+    tick rate while the project is drawn at the display rate. It keeps running averages of the time taken to build a
+    netlist in the renderer and to solve it in the worker. If either cannot keep up with the tick rate, ticks are
+    spaced out to the rate that can be sustained, up to a limit, and any change to the project wakes the scheduler so
+    that it is simulated on the next frame."""
+
+    def __init__(self, rate=SIMULATION_RATE):
+        self.period = 1 / rate
+        self.interval = self.period
+        self.netlist = 0
+        self.solve = 0
+        self.next = 0
+
+    # Check if a tick is due, and if it is, schedule the next one
+    def due(self):
+        now = time.perf_counter()
+        if now < self.next:
+            return False
+        self.next = now + self.interval
+        return True
+
+    # Make the next tick due straight away
+    def wake(self):
+        self.next = 0
+
+    # Add the time taken to build or solve a netlist to the running averages, and space out ticks if the renderer or
+    # the worker is falling behind
+    def record(self, netlist=None, solve=None):
+        if netlist is not None:
+            self.netlist += SMOOTHING * (netlist - self.netlist)
+        if solve is not None:
+            self.solve += SMOOTHING * (solve - self.solve)
+        self.interval = min(THROTTLE_LIMIT, max(self.period, self.solve, self.netlist / NETLIST_SHARE))
+
+    # Check if ticks have been spaced out because the renderer or the worker cannot keep up
+    def throttled(self):
+        return self.interval > self.period
+
+    # Return the number of ticks per second currently being run
+    def rate(self):
+        return 1 / self.interval
@@ -0,0 +1,56 @@
+import pygame
+
+# If the changed regions of a frame cover more than this share of the window, or there are more of them than the
+# limit, the whole window is presented at once
+FULL_SHARE = 0.5
+RECT_LIMIT = 32
+
+
+class Damage:
+    """The damage structure collects the regions of the window which changed during a frame, so that only those
+    regions are presented to the display. Overlays are tracked by their region and content, so that both their old
+    and new regions are presented when either changes."""
+
+    def __init__(self, size):
+        self.window = pygame.Rect((0, 0), size)
+        self.rects = []
+        self.full = False
+        self.overlays = {}
+
+    # Mark regions of the window as changed, ignoring any which are None
+    def add(self, *rects):
+        self.rects.extend(pygame.Rect(i) for i in rects if i is not None)
+
+    # Mark the whole window as changed
+    def add_all(self):
+        self.full = True
+
+    # Mark the previous and current regions of an overlay as changed if its region or content has changed since the
+    # previous frame. An overlay which is not drawn has no region
+    def track(self, name, rect=None, content=None):
+        state = (None if rect is None else tuple(rect), content)
+        previous = self.overlays.get(name, (None, None))
+        if state != previous:
+            self.add(previous[0], rect)
+        self.overlays[name] = state
+
+    # Return the changed regions of the window, or the whole window if they cover too much of it to be handled one by
+    # one, so that only these regions need to be drawn
+    def regions(self):
+        rects = [i.clip(self.window) for i in self.rects]
+        rects = [i for i in rects if i.w and i.h]
+        if self.full or len(rects) > RECT_LIMIT or sum(i.w * i.h for i in rects) > FULL_SHARE * self.window.w * \
+                self.window.h:
+            return [self.window]
+        return rects
+
+    # Present the changed regions of the window to the display and start collecting the next frame. Return the number
+    # of pixels presented
+    def present(self):
+        rects = self.regions()
+        self.rects, self.full = [], False
+        if rects == [self.window]:
+            pygame.display.update()
+        elif rects:
+            pygame.display.update(rects)
+        return sum(i.w * i.h for i in rects)